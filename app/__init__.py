@@ -4,7 +4,6 @@ import rq
 # from logging.handlers import SMTPHandler, RotatingFileHandler
 from redis import Redis
 from flask import Flask
-# from elasticsearch import Elasticsearch
 from flask_sqlalchemy import SQLAlchemy
 from flask_bootstrap import Bootstrap
 from flask_migrate import Migrate
@@ -43,9 +42,33 @@ def create_app(config_name):
     app.redis = Redis.from_url(app.config['REDIS_URL'])
     app.task_queue = rq.Queue('flask_proj-tasks', connection=app.redis)
 
-    # not implemented yet!!!!
-    # app.elasticsearch = Elasticsearch([app.config['ELASTICSEARCH_URL']]) \
-    # if app.config['ELASTICSEARCH_URL'] else None
+    # outgoing mail through a bounded queue and pooled smtp connections
+    from app.mailer import MailQueue
+    app.mail_queue = MailQueue(app, mail)
+
+    # password hashing in a bounded process pool
+    from app.hashing import PasswordHasher
+    app.password_hasher = PasswordHasher(app)
+
+    # api token and session user lookups cached per worker and in redis
+    from app.auth_cache import TokenCache, PrincipalCache
+    app.token_cache = TokenCache(app)
+    app.user_cache = PrincipalCache(app)
+
+    # full-text search over posts (sqlite FTS5 / postgres tsvector)
+    from app.search import create_search_backend
+    app.search = create_search_backend(app)
+
+    # gzip/brotli for text responses, streamed ones included
+    if app.config['COMPRESS']:
+        from app.compress import CompressMiddleware
+        app.wsgi_app = CompressMiddleware(app.wsgi_app, min_size=app.config['COMPRESS_MIN_SIZE'],
+                                          level=app.config['COMPRESS_LEVEL'],
+                                          brotli_quality=app.config['COMPRESS_BR_QUALITY'])
+
+    # fingerprinted static files, when `flask assets` has been run
+    from app import assets
+    assets.init_app(app)
 
     # blueprint
     from app.main import main as main_blueprint
@@ -2,4 +2,4 @@ from flask import Blueprint
 
 api = Blueprint('api', __name__)
 
-from . import users, errors, tokens, posts
+from . import users, errors, tokens, posts, notifications
@@ -1,4 +1,5 @@
 from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth
+from app import db
 from app.models import User
 from app.api.errors import error_response
 
@@ -11,6 +12,7 @@ token_auth = HTTPTokenAuth()
 def verify_password(email, password):
     user = User.query.filter_by(email=email).first()
     if user and user.check_password(password):
+        db.session.commit()   # keeps an upgraded password hash
         return user
 
 
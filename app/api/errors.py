@@ -1,5 +1,7 @@
 from flask import jsonify
 from werkzeug.http import HTTP_STATUS_CODES
+from app.exceptions import ValidationError, PasswordHashingBusy, MailQueueFull
+from . import api
 
 
 def error_response(status_code, message=None):
@@ -18,4 +20,17 @@ def forbidden(message):
 
 
 def bad_request(message):
-    return error_response(400, message)
\ No newline at end of file
+    return error_response(400, message)
+
+
+@api.errorhandler(ValidationError)
+def validation_error(e):
+    return bad_request(e.args[0])
+
+
+@api.errorhandler(PasswordHashingBusy)
+@api.errorhandler(MailQueueFull)
+def password_hashing_busy(e):
+    response = error_response(503, 'server busy, try again later')
+    response.headers['Retry-After'] = '1'
+    return response
@@ -0,0 +1,12 @@
+from flask import jsonify, request
+from . import api
+from app.api.auth import token_auth
+
+
+# polling fallback for clients that cannot hold the event stream open
+@api.route('/notifications', methods=['GET'])
+@token_auth.login_required
+def get_notifications():
+    since = request.args.get('since', 0.0, type=float)
+    user = token_auth.current_user()
+    return jsonify([n.to_dict() for n in user.get_notifications(since)])
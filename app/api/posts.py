@@ -1,9 +1,12 @@
-from flask import jsonify, request, g, url_for, session
+from flask import jsonify, request, g, url_for, session, json, Response, stream_with_context
 from flask_login import current_user
 from .. import db
 from app.models import Post, Permission
 from . import api
 from .errors import forbidden
+from ..cache import cached, add_cache_tags, invalidate, make_etag, not_modified, add_validators
+from .auth import token_auth
+from ..pagination import keyset_paginate
 
 
 # @bp.before_request
@@ -13,29 +16,83 @@ from .errors import forbidden
 
 @api.route('/posts/')
 def get_posts():
+    # streamed, so not kept in the response cache: repeat reads are
+    # answered by the ETag check before any post is loaded
+    # legacy offset pagination, only when a page number is asked for
+    if 'page' not in request.args:
+        return get_posts_keyset()
     page = request.args.get('page', 1, type=int)
     pagination = Post.query.paginate(
         page, per_page=10,
         error_out=False)
     posts = pagination.items
+    etag = make_etag(page, pagination.total, [(post.id, post.updated) for post in posts])
+    response = not_modified(etag, per_user=False)
+    if response:
+        return response
     prev = None
     if pagination.has_prev:
         prev = url_for('api.get_posts', page=page - 1)
     next = None
     if pagination.has_next:
         next = url_for('api.get_posts', page=page + 1)
-    return jsonify({
-        'posts': [post.to_json() for post in posts],
-        'prev': prev,
-        'next': next,
-        'count': pagination.total
-    })
+    return add_validators(stream_posts(posts, prev, next, pagination.total), etag, per_user=False)
+
+
+# cursor pagination: /posts/?after=<cursor>, total only with ?count=1
+def get_posts_keyset():
+    per_page = min(request.args.get('per_page', 10, type=int), 100)
+    with_total = request.args.get('count', 0, type=int) == 1
+    # page through the sort keys only; the posts are loaded after the ETag check
+    pagination = keyset_paginate(db.session.query(Post.id, Post.created, Post.updated), Post,
+                                 after=request.args.get('after'),
+                                 per_page=per_page, with_total=with_total)
+    # the next link depends on the rows past the page, so it is part of the ETag
+    etag = make_etag(pagination.total, pagination.next_cursor, pagination.has_next, per_page,
+                     [(row.id, row.updated) for row in pagination.items])
+    response = not_modified(etag, per_user=False)
+    if response:
+        return response
+    next = None
+    if pagination.has_next:
+        next = url_for('api.get_posts', after=pagination.next_cursor, per_page=per_page)
+    ids = [row.id for row in pagination.items]
+    found = {post.id: post for post in Post.query.filter(Post.id.in_(ids))} if ids else {}
+    posts = [found[id] for id in ids if id in found]
+    return add_validators(stream_posts(posts, None, next, pagination.total), etag, per_user=False)
+
+
+# write the posts page out post by post instead of building it in memory
+def stream_posts(posts, prev, next, count):
+    def generate():
+        yield '{"posts": ['
+        for i, data in enumerate(Post.iter_json(posts)):
+            yield (',' if i else '') + json.dumps(data)
+        yield '], ' + json.dumps({'prev': prev, 'next': next, 'count': count})[1:]
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 
 @api.route('/posts/<int:id>')
+@cached(per_user=False)
 def get_post(id):
+    updated = db.session.query(Post.updated).filter(Post.id == id).first_or_404().updated
+    etag = make_etag(id, updated)
+    response = not_modified(etag, updated, per_user=False)
+    if response:
+        return response
+    post = Post.query.get_or_404(id)
+    add_cache_tags('post:%d' % post.id)
+    return add_validators(jsonify(post.to_json()), etag, updated, per_user=False)
+
+
+@api.route('/posts/<int:id>/like', methods=['POST', 'DELETE'])
+@token_auth.login_required
+def like_post(id):
     post = Post.query.get_or_404(id)
-    return jsonify(post.to_json())
+    token_auth.current_user().toggle_like(post, request.method == 'POST')
+    invalidate('post:%d' % post.id, 'post-list')
+    return jsonify({'liked': request.method == 'POST',
+                    'likes': Post.preload_feed([post]).like_count(post)})
 
 
 # @bp.route('/posts/', methods=['POST'])
@@ -0,0 +1,113 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+from flask import current_app, request, send_from_directory
+from werkzeug.exceptions import NotFound
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# fingerprinted copies of app/static, written by `flask assets`:
+#   static/dist/style.3f9c1e0b7a2d.css      content hash in the name
+#   static/dist/style.3f9c1e0b7a2d.css.gz   gzip / brotli siblings of text files
+#   static/dist/style.3f9c1e0b7a2d.css.br
+#   static/dist/manifest.json               {"style.css": "dist/style.3f9c1e0b7a2d.css"}
+# With a manifest present, url_for('static', filename=...) points at the
+# hashed copy, which is served with the best sibling the client accepts
+# and cached for good.
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map', '.ico')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _hashed_name(path, data):
+    stem, ext = os.path.splitext(path)
+    return '{}.{}{}'.format(stem, hashlib.sha256(data).hexdigest()[:12], ext)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+# write the fingerprinted tree and its manifest; returns the manifest
+def build(static_folder):
+    dist = os.path.join(static_folder, DIST)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root) == os.path.abspath(static_folder) and DIST in dirs:
+            dirs.remove(DIST)
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            hashed = _hashed_name(logical, data)
+            target = os.path.join(dist, hashed)
+            _write(target, data)
+            if name.endswith(COMPRESSIBLE):
+                compressed = gzip.compress(data, compresslevel=9, mtime=0)
+                if len(compressed) < len(data):
+                    _write(target + '.gz', compressed)
+                if brotli is not None:
+                    compressed = brotli.compress(data, quality=11)
+                    if len(compressed) < len(data):
+                        _write(target + '.br', compressed)
+            manifest[logical] = DIST + '/' + hashed
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest(static_folder):
+    try:
+        with open(os.path.join(static_folder, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def init_app(app):
+    app.assets_manifest = load_manifest(app.static_folder)
+    if not app.assets_manifest:
+        return
+
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in current_app.assets_manifest:
+            values['filename'] = current_app.assets_manifest[values['filename']]
+
+    plain = app.view_functions['static']
+
+    def static(filename):
+        if not filename.startswith(DIST + '/'):
+            return plain(filename)
+        return send_fingerprinted(filename)
+
+    app.view_functions['static'] = static
+
+
+def send_fingerprinted(filename):
+    folder = current_app.static_folder
+    response = None
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding] and \
+                os.path.isfile(os.path.join(folder, filename + suffix)):
+            try:
+                response = send_from_directory(folder, filename + suffix, conditional=True)
+            except NotFound:
+                continue
+            response.content_encoding = encoding
+            response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            break
+    if response is None:
+        response = send_from_directory(folder, filename, conditional=True)
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
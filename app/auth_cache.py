@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from redis.exceptions import RedisError
+
+
+# in-process LRU with a per-entry expiry, shared by the threads of one worker
+class LocalCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# two-level cache (worker LRU + redis) of JSON data. evict() drops the
+# redis entry and tells every worker, over pub/sub, to drop its local copy.
+# While a worker is not subscribed it cannot hear evictions, so it skips
+# its local level until it is.
+class TwoLevelCache:
+    key_prefix = None
+    channel = None
+    evict_all_message = '*'
+
+    def __init__(self, app, enabled, ttl, size):
+        self.redis = app.redis
+        self.enabled = enabled
+        self.ttl = ttl
+        self.local = LocalCache(size)
+        self.local_enabled = False
+        self._listener_pid = None
+        self._lock = threading.Lock()
+        self.logger = app.logger
+
+    def _key(self, key):
+        return str(key)
+
+    def _ensure_listener(self):
+        # threads do not survive a fork, so every worker process starts its own
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid != os.getpid():
+                self._listener_pid = os.getpid()
+                self.local_enabled = False
+                self.local.clear()
+                threading.Thread(target=self._listen, daemon=True).start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self.local_enabled = True
+                for message in pubsub.listen():
+                    key = message['data'].decode('utf-8')
+                    if key == self.evict_all_message:
+                        self.local.clear()
+                    else:
+                        self.local.pop(key)
+            except RedisError:
+                self.local_enabled = False
+                self.local.clear()
+                time.sleep(5)
+
+    # seconds an entry may live
+    def _ttl(self, data):
+        return self.ttl
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        self._ensure_listener()
+        key = self._key(key)
+        if self.local_enabled:
+            data = self.local.get(key)
+            if data is not None:
+                return data
+        try:
+            raw = self.redis.get(self.key_prefix + key)
+        except RedisError:
+            self.logger.warning('%s cache unavailable', self.key_prefix, exc_info=True)
+            return None
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        ttl = self._ttl(data)
+        if self.local_enabled and ttl > 0:
+            self.local.set(key, data, ttl)
+        return data
+
+    def set(self, key, data):
+        if not self.enabled:
+            return
+        key = self._key(key)
+        ttl = self._ttl(data)
+        if ttl <= 0:
+            return
+        if self.local_enabled:
+            self.local.set(key, data, ttl)
+        try:
+            self.redis.set(self.key_prefix + key, json.dumps(data), ex=int(ttl) or 1)
+        except RedisError:
+            self.logger.warning('%s cache unavailable', self.key_prefix, exc_info=True)
+
+    def evict(self, key):
+        if not self.enabled or key is None:
+            return
+        key = self._key(key)
+        self.local.pop(key)
+        try:
+            pipe = self.redis.pipeline()
+            pipe.delete(self.key_prefix + key)
+            pipe.publish(self.channel, key)
+            pipe.execute()
+        except RedisError:
+            self.logger.error('%s cache eviction failed', self.key_prefix, exc_info=True)
+
+    def evict_all(self):
+        if not self.enabled:
+            return
+        self.local.clear()
+        try:
+            keys = list(self.redis.scan_iter(match=self.key_prefix + '*', count=500))
+            for i in range(0, len(keys), 500):
+                self.redis.delete(*keys[i:i + 500])
+            self.redis.publish(self.channel, self.evict_all_message)
+        except RedisError:
+            self.logger.error('%s cache eviction failed', self.key_prefix, exc_info=True)
+
+
+# API token -> User.cache_data(); entries never outlive the token
+class TokenCache(TwoLevelCache):
+    key_prefix = 'auth:token:'
+    channel = 'auth:token-evicted'
+
+    def __init__(self, app):
+        super(TokenCache, self).__init__(app, app.config['TOKEN_CACHE'],
+                                         app.config['TOKEN_CACHE_TTL'],
+                                         app.config['TOKEN_CACHE_SIZE'])
+
+    def _key(self, token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def _ttl(self, data):
+        expires = datetime.fromisoformat(data['token_expiration'])
+        return min(self.ttl, (expires - datetime.utcnow()).total_seconds())
+
+
+# user id -> User.principal_data() for Flask-Login's user_loader, so that
+# a page render needs no user or role query; short-lived, and evicted when
+# the user row or any role changes
+class PrincipalCache(TwoLevelCache):
+    key_prefix = 'auth:user:'
+    channel = 'auth:user-evicted'
+
+    def __init__(self, app):
+        super(PrincipalCache, self).__init__(app, app.config['PRINCIPAL_CACHE'],
+                                             app.config['PRINCIPAL_CACHE_TTL'],
+                                             app.config['PRINCIPAL_CACHE_SIZE'])
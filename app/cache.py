@@ -0,0 +1,146 @@
+import hashlib
+from functools import wraps
+from flask import current_app, request, g, session, make_response
+from flask_login import current_user
+from redis.exceptions import RedisError
+
+
+# response cache for read-heavy pages, stored in app.redis:
+#   cache:view:<endpoint>:<auth class>:<hash of url>  hash of status/content type/body
+#   cache:tag:<tag>                                   set of cache keys to drop on writes
+KEY_PREFIX = 'cache:view:'
+TAG_PREFIX = 'cache:tag:'
+
+# drop the tag sets and every key in them as one step, so a key tagged
+# while invalidating cannot leave the set and survive
+INVALIDATE = """
+for _, tag in ipairs(KEYS) do
+    for _, key in ipairs(redis.call('smembers', tag)) do
+        redis.call('del', key)
+    end
+    redis.call('del', tag)
+end
+"""
+
+
+def _auth_class(per_user):
+    if not current_user.is_authenticated:
+        return 'anon'
+    # pages showing per-user state (like buttons, flashes) are not shared
+    return None if per_user else 'any'
+
+
+def _cache_key(per_user):
+    if not current_app.config['RESPONSE_CACHE'] or request.method not in ('GET', 'HEAD'):
+        return None
+    if '_flashes' in session:
+        return None
+    auth = _auth_class(per_user)
+    if auth is None:
+        return None
+    args = '&'.join('{}={}'.format(k, v) for k, v in sorted(request.args.items(multi=True)))
+    digest = hashlib.sha1('{}?{}'.format(request.path, args).encode('utf-8')).hexdigest()
+    return '{}{}:{}:{}'.format(KEY_PREFIX, request.endpoint, auth, digest)
+
+
+# tag the response being rendered, for tags only known inside the view
+def add_cache_tags(*tags):
+    if 'cache_tags' in g:
+        g.cache_tags.update(tags)
+
+
+def _load(key):
+    entry = current_app.redis.hgetall(key)
+    if not entry:
+        return None
+    response = current_app.response_class(entry[b'body'], status=int(entry[b'status']),
+                                          content_type=entry[b'content_type'].decode('utf-8'))
+    for header in ('ETag', 'Last-Modified'):
+        if header.encode('ascii') in entry:
+            response.headers[header] = entry[header.encode('ascii')].decode('ascii')
+    response.headers['X-Cache'] = 'HIT'
+    return response.make_conditional(request)
+
+
+def _store(key, response, tags, timeout):
+    # only plain 200s without cookies of their own are safe to share; a
+    # streamed body would have to be read into memory first
+    if response.status_code != 200 or 'Set-Cookie' in response.headers or \
+            response.is_streamed:
+        return
+    entry = {'status': response.status_code,
+             'content_type': response.content_type,
+             'body': response.get_data()}
+    for header in ('ETag', 'Last-Modified'):
+        if header in response.headers:
+            entry[header] = response.headers[header]
+    pipe = current_app.redis.pipeline()
+    pipe.hset(key, mapping=entry)
+    pipe.expire(key, timeout)
+    for tag in tags:
+        pipe.sadd(TAG_PREFIX + tag, key)
+        pipe.expire(TAG_PREFIX + tag, timeout)
+    pipe.execute()
+
+
+# cache a GET view's response in Redis until invalidate(tag) or timeout;
+# with per_user=True (pages rendering current_user state) only anonymous
+# visitors share cached responses
+def cached(*tags, timeout=None, per_user=True):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = _cache_key(per_user)
+            if key is None:
+                return f(*args, **kwargs)
+            try:
+                response = _load(key)
+            except RedisError:
+                current_app.logger.warning('response cache unavailable', exc_info=True)
+                return f(*args, **kwargs)
+            if response is not None:
+                return response
+            g.cache_tags = set(tags)
+            response = make_response(f(*args, **kwargs))
+            try:
+                _store(key, response, g.cache_tags,
+                       timeout or current_app.config['RESPONSE_CACHE_TIMEOUT'])
+            except RedisError:
+                current_app.logger.warning('response cache unavailable', exc_info=True)
+            return response
+        return decorated_function
+    return decorator
+
+
+# drop every cached response tagged with any of `tags`
+def invalidate(*tags):
+    if not current_app.config['RESPONSE_CACHE']:
+        return
+    try:
+        current_app.redis.register_script(INVALIDATE)(keys=[TAG_PREFIX + tag for tag in tags])
+    except RedisError:
+        current_app.logger.warning('response cache invalidation failed', exc_info=True)
+
+
+# conditional GET: a weak ETag built from cheap validator values, so a view
+# can answer 304 before loading or rendering anything
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def not_modified(etag, last_modified=None, per_user=True):
+    if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+        return None
+    response = current_app.response_class()
+    add_validators(response, etag, last_modified, per_user)
+    response.make_conditional(request)
+    return response if response.status_code == 304 else None
+
+
+def add_validators(response, etag, last_modified=None, per_user=True):
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(microsecond=0)
+    if per_user:
+        response.vary.add('Cookie')
+    return response
@@ -0,0 +1,71 @@
+import calendar
+import locale
+import threading
+from datetime import date, timedelta
+from functools import lru_cache
+from markupsafe import escape
+
+
+# the month/year tables are the same for every request, so they are built
+# once per (year, month, locale) and kept; events and today are merged in
+# afterwards by marking the cells, which carry their date:
+#   <td class="mon" data-date="2026-10-05">5</td>
+class DatedHTMLCalendar(calendar.LocaleHTMLCalendar):
+    def formatmonth(self, theyear, themonth, withyear=True):
+        self._month = (theyear, themonth)
+        return super(DatedHTMLCalendar, self).formatmonth(theyear, themonth, withyear)
+
+    def formatday(self, day, weekday):
+        if day == 0:
+            return super(DatedHTMLCalendar, self).formatday(day, weekday)
+        return '<td class="{}" data-date="{}">{}</td>'.format(
+            self.cssclasses[weekday], date(*self._month, day).isoformat(), day)
+
+
+# LocaleHTMLCalendar switches the process locale while it renders
+_render_lock = threading.Lock()
+
+
+# a locale the system does not have falls back to plain English names
+def _render(render, locale_name):
+    with _render_lock:
+        try:
+            return render(DatedHTMLCalendar(locale=locale_name))
+        except locale.Error:
+            return render(DatedHTMLCalendar(locale='C'))
+
+
+@lru_cache(maxsize=256)
+def month_grid(year, month, locale_name):
+    return _render(lambda cal: cal.formatmonth(year, month), locale_name)
+
+
+@lru_cache(maxsize=64)
+def year_grid(year, locale_name):
+    return _render(lambda cal: cal.formatyear(year), locale_name)
+
+
+# first and last day shown by a month, or by a whole year when month is None
+def visible_range(year, month=None):
+    if month is None:
+        return date(year, 1, 1), date(year, 12, 31)
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+# mark the cells of `today` and of the days between `first` and `last`
+# covered by `events` in a grid
+def overlay(grid, first, last, events=(), today=None):
+    titles = {}
+    for event in events:
+        day, end = max(event.start.date(), first), min(event.end.date(), last)
+        while day <= end:
+            titles.setdefault(day, []).append(event.title)
+            day += timedelta(days=1)
+    for day, names in titles.items():
+        cell = ' data-date="{}">'.format(day.isoformat())
+        grid = grid.replace(cell, ' data-date="{}" data-events="{}" title="{}">'.format(
+            day.isoformat(), len(names), escape('; '.join(names))), 1)
+    if today is not None:
+        cell = '" data-date="{}"'.format(today.isoformat())
+        grid = grid.replace(cell, ' today' + cell, 1)
+    return grid
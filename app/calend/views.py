@@ -1,7 +1,12 @@
-import calendar   
-from flask import render_template
+from datetime import date, datetime
+from flask import render_template, request, jsonify, current_app, abort
+from flask_login import current_user, login_required
+from markupsafe import Markup
 from . import calend
-from datetime import date
+from .grid import month_grid, year_grid, visible_range, overlay
+from .. import db
+from ..exceptions import ValidationError
+from ..models import Event, Permission
 
 
 # take date now
@@ -11,16 +16,66 @@ def date_now():
     return today
 
 
-# settings calendar
-def create_calendar():    
-    aln = calendar.LocaleHTMLCalendar(locale="C.UTF-8")
-    show = aln.formatyear(2022)
-    return show
+# ?locale= when it is one of CALENDAR_LOCALES
+def calendar_locale():
+    name = request.args.get('locale')
+    if name in current_app.config['CALENDAR_LOCALES']:
+        return name
+    return current_app.config['CALENDAR_LOCALES'][0]
 
 
-# showcalendar with date today
+def parse_day(value, name):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValidationError('{} must be a date like 2022-01-31'.format(name))
+
+
+# showcalendar with date today: the whole year, or one month with ?month=
 @calend.route('/calendar', methods=['GET'])
 def show_calendar():
-    calendarq = create_calendar
-    dateq = date_now()
-    return render_template('calendar/calendar_d.html', calendarq=calendarq, dateq=dateq)
+    today = date.today()
+    year = request.args.get('year', today.year, type=int)
+    month = request.args.get('month', type=int)
+    if not 1 <= year <= 9999 or (month is not None and not 1 <= month <= 12):
+        abort(404)
+    name = calendar_locale()
+    grid = year_grid(year, name) if month is None else month_grid(year, month, name)
+    first, last = visible_range(year, month)
+    calendarq = Markup(overlay(grid, first, last, Event.in_range(first, last), today))
+    return render_template('calendar/calendar_d.html', calendarq=calendarq, dateq=date_now(),
+                           year=year, month=month)
+
+
+# events overlapping ?start=..&end= (ISO dates, both days included)
+@calend.route('/events', methods=['GET'])
+def events():
+    first = parse_day(request.args.get('start'), 'start')
+    last = parse_day(request.args.get('end'), 'end')
+    if last < first or (last - first).days > current_app.config['CALENDAR_MAX_RANGE']:
+        raise ValidationError('range must be at most {} days'.format(
+            current_app.config['CALENDAR_MAX_RANGE']))
+    return jsonify({'events': [event.to_dict() for event in Event.in_range(first, last)]})
+
+
+@calend.route('/events', methods=['POST'])
+@login_required
+def create_event():
+    if not current_user.can(Permission.MODERATE):
+        abort(403)
+    data = request.get_json() or {}
+    try:
+        start = datetime.fromisoformat(data['start'])
+        end = datetime.fromisoformat(data.get('end') or data['start'])
+    except (KeyError, TypeError, ValueError):
+        raise ValidationError('start and end must be ISO dates')
+    # stored as the calendar's wall-clock time; an offset would be dropped
+    if start.tzinfo is not None or end.tzinfo is not None:
+        raise ValidationError('start and end are local times, without a UTC offset')
+    if not data.get('title') or end < start:
+        raise ValidationError('title required, end not before start')
+    event = Event(title=data['title'], description=data.get('description'),
+                  start=start, end=end, author_id=current_user.id)
+    db.session.add(event)
+    db.session.commit()
+    return jsonify(event.to_dict()), 201
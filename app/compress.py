@@ -0,0 +1,106 @@
+import zlib
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header, parse_options_header
+from werkzeug.wsgi import ClosingIterator
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# WSGI middleware compressing text responses with brotli or gzip, chunk by
+# chunk as the app yields them, so streamed responses stay streamed.
+# Skipped: clients that accept neither, bodies with a known length under
+# min_size, types not in COMPRESSIBLE (images, archives, event streams),
+# and responses that already carry a Content-Encoding.
+COMPRESSIBLE = {'text/html', 'text/css', 'text/plain', 'text/xml', 'text/csv',
+                'text/javascript', 'application/javascript', 'application/json',
+                'application/x-ndjson', 'application/xml', 'image/svg+xml'}
+
+
+class CompressMiddleware:
+    def __init__(self, wsgi_app, min_size=500, level=6, brotli_quality=4):
+        self.wsgi_app = wsgi_app
+        self.min_size = min_size
+        self.level = level
+        self.brotli_quality = brotli_quality
+
+    def _negotiate(self, environ):
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and accept['br']:
+            return 'br'
+        if accept['gzip']:
+            return 'gzip'
+        return None
+
+    def _compressible(self, status, headers):
+        if not status.startswith('200') or 'Content-Encoding' in headers or \
+                'Content-Range' in headers or \
+                'no-transform' in headers.get('Cache-Control', ''):
+            return False
+        mimetype = parse_options_header(headers.get('Content-Type', ''))[0]
+        if mimetype not in COMPRESSIBLE:
+            return False
+        length = headers.get('Content-Length')
+        return length is None or int(length) >= self.min_size
+
+    def __call__(self, environ, start_response):
+        encoding = None
+        if environ['REQUEST_METHOD'] != 'HEAD':
+            encoding = self._negotiate(environ)
+        state = {'started': False, 'compress': False}
+
+        def compressing_start_response(status, headers, exc_info=None):
+            headers = Headers(headers)
+            state['started'] = True
+            if self._compressible(status, headers):
+                # the body depends on Accept-Encoding even when sent plain
+                vary = headers.get('Vary')
+                if not vary:
+                    headers['Vary'] = 'Accept-Encoding'
+                elif 'accept-encoding' not in vary.lower():
+                    headers['Vary'] = vary + ', Accept-Encoding'
+                if encoding is not None:
+                    state['compress'] = True
+                    headers.pop('Content-Length', None)
+                    headers['Content-Encoding'] = encoding
+                    etag = headers.get('ETag')
+                    # the compressed body is not byte-identical any more
+                    if etag and not etag.startswith('W/'):
+                        headers['ETag'] = 'W/' + etag
+            return start_response(status, headers.to_wsgi_list(), exc_info)
+
+        app_iter = self.wsgi_app(environ, compressing_start_response)
+        if state['started'] and not state['compress']:
+            return app_iter
+        # a generator app calls start_response only once iterated, so
+        # whether to compress is known for sure inside the iteration
+        return ClosingIterator(self._compress(app_iter, encoding, state),
+                               getattr(app_iter, 'close', None))
+
+    def _compressor(self, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            return compressor.process, compressor.flush, compressor.finish
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return (compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+                compressor.flush)
+
+    # every chunk the app yields is flushed out, so a streamed response
+    # reaches the client as it is produced
+    def _compress(self, app_iter, encoding, state):
+        process = None
+        for chunk in app_iter:
+            if not state['compress']:
+                yield chunk
+                continue
+            if process is None:
+                process, flush, finish = self._compressor(encoding)
+            data = process(chunk) + flush()
+            if data:
+                yield data
+        if state['compress']:
+            if process is None:
+                process, flush, finish = self._compressor(encoding)
+            yield finish()
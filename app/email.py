@@ -1,14 +1,8 @@
-from threading import Thread
 from flask import current_app
 from flask_mail import Message
-from app import mail
-
-
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
 
 
+# queued on app.mail_queue (app/mailer.py); sync sends before returning
 def send_email(subject, sender, recipients, text_body, html_body,
                attachments=None, sync=False):
     msg = Message(subject, sender=sender, recipients=recipients)
@@ -18,7 +12,6 @@ def send_email(subject, sender, recipients, text_body, html_body,
         for attachment in attachments:
             msg.attach(*attachment)
     if sync:
-        mail.send(msg)
+        current_app.mail_queue.send_batch([msg])
     else:
-        Thread(target=send_async_email,
-               args=(current_app._get_current_object(), msg)).start()
+        current_app.mail_queue.send(msg)
@@ -1,2 +1,18 @@
 class ValidationError(ValueError):
     pass
+
+
+class PasswordHashingBusy(RuntimeError):
+    pass
+
+
+class MailQueueFull(RuntimeError):
+    pass
+
+
+class OutOfStock(RuntimeError):
+    pass
+
+
+class IdempotencyKeyReused(RuntimeError):
+    pass
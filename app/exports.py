@@ -0,0 +1,56 @@
+import gzip
+import json
+import os
+from flask import current_app
+from app import db
+from app.models import Post
+
+
+FORMATS = ('ndjson', 'json')
+
+
+def export_path(task_id, fmt):
+    return os.path.join(current_app.config['EXPORT_FOLDER'], '{}.{}.gz'.format(task_id, fmt))
+
+
+# the finished export file of a task, or None
+def find_export(task_id):
+    for fmt in FORMATS:
+        path = export_path(task_id, fmt)
+        if os.path.exists(path):
+            return path, fmt
+    return None
+
+
+def _row(post):
+    return {'title': post.title, 'body': post.body,
+            'timestamp': post.created.isoformat() + 'Z'}
+
+
+# stream a user's posts into a gzip file, chunk_size rows at a time, calling
+# progress(done, total) after each chunk; the file only appears under its
+# final name once complete
+def write_export(user_id, path, fmt='ndjson', chunk_size=500, progress=None):
+    query = db.session.query(Post.title, Post.body, Post.created).filter(
+        Post.author_id == user_id)
+    total = query.order_by(None).count()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + '.part'
+    done = 0
+    with gzip.open(partial, 'wt', encoding='utf-8') as f:
+        if fmt == 'json':
+            f.write('{"posts": [\n')
+        for post in query.order_by(Post.created.asc(), Post.id.asc()).yield_per(chunk_size):
+            line = json.dumps(_row(post))
+            if fmt == 'json':
+                line = (',\n' if done else '') + line
+            else:
+                line += '\n'
+            f.write(line)
+            done += 1
+            if progress is not None and done % chunk_size == 0:
+                progress(done, total)
+        if fmt == 'json':
+            f.write('\n]}\n')
+    os.replace(partial, path)
+    return done
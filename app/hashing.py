@@ -0,0 +1,107 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from passlib.context import CryptContext
+from werkzeug.security import check_password_hash
+from app.exceptions import PasswordHashingBusy
+
+
+SCHEMES = ['bcrypt', 'pbkdf2_sha256']
+
+
+@lru_cache(maxsize=None)
+def _context(scheme, rounds):
+    settings = {'{}__rounds'.format(scheme): rounds} if rounds else {}
+    return CryptContext(schemes=SCHEMES, default=scheme, deprecated='auto', **settings)
+
+
+# hashes made by werkzeug.security before passlib, e.g. "pbkdf2:sha256:150000$..."
+def _is_legacy(pwhash):
+    return pwhash.startswith(('pbkdf2:', 'plain$', 'md5$', 'sha1$', 'sha256$'))
+
+
+# run in the pool processes, so module level and picklable
+def _hash(scheme, rounds, password):
+    return _context(scheme, rounds).hash(password)
+
+
+# (matches, new hash when the stored one is legacy or below the current cost)
+def _verify(scheme, rounds, password, pwhash):
+    if not pwhash:
+        return False, None
+    if _is_legacy(pwhash):
+        if not check_password_hash(pwhash, password):
+            return False, None
+        return True, _hash(scheme, rounds, password)
+    context = _context(scheme, rounds)
+    try:
+        matches, new_hash = context.verify_and_update(password, pwhash)
+    except ValueError:
+        return False, None
+    return matches, new_hash
+
+
+# password hashing off the request worker: a bounded process pool, and a
+# request that cannot get a slot within PASSWORD_HASH_QUEUE_TIMEOUT gets
+# PasswordHashingBusy instead of piling up, as does one whose hash is not
+# done within PASSWORD_HASH_TIMEOUT. A pool that lost a child, or holds a
+# stuck one, is dropped and made again. With no pool workers configured
+# the hashing runs inline.
+class PasswordHasher:
+    def __init__(self, app):
+        self.scheme = app.config['PASSWORD_HASH_SCHEME']
+        self.rounds = app.config['PASSWORD_HASH_ROUNDS']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.queue_timeout = app.config['PASSWORD_HASH_QUEUE_TIMEOUT']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(
+            max(self.workers, 1) * app.config['PASSWORD_HASH_QUEUE_SIZE'])
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        # a pool inherited through fork is unusable, every worker makes its own
+        if self._pool_pid != os.getpid():
+            with self._lock:
+                if self._pool_pid != os.getpid():
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                    self._pool_pid = os.getpid()
+        return self._pool
+
+    def _drop_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+                self._pool_pid = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(self.scheme, self.rounds, *args)
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise PasswordHashingBusy('password hashing queue is full')
+        try:
+            # a broken pool is retried once, on a new one
+            for retry in (True, False):
+                pool = self._get_pool()
+                try:
+                    return pool.submit(fn, self.scheme, self.rounds, *args).result(
+                        timeout=self.timeout)
+                except BrokenProcessPool:
+                    self._drop_pool(pool)
+                    if not retry:
+                        raise PasswordHashingBusy('password hashing pool is broken')
+                except TimeoutError:
+                    self._drop_pool(pool)
+                    raise PasswordHashingBusy('password hashing timed out')
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash, password)
+
+    def verify(self, password, pwhash):
+        return self._run(_verify, password, pwhash)
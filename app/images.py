@@ -0,0 +1,168 @@
+import io
+import os
+from flask import current_app, url_for
+from redis.exceptions import RedisError
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+
+# resized copies of uploaded images, made by the RQ job
+# app.tasks.make_image_variants: for every IMAGE_WIDTHS width narrower than
+# the original a progressive JPEG and a WebP, kept in the upload store
+# (app/uploads.py) and listed in image_variants. Templates pick them up
+# through srcsets(), see templates/_image.html.
+FORMATS = {'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+           'webp': {'format': 'WEBP', 'quality': 80, 'method': 6}}
+
+
+EXTENSIONS = ('jpg', 'jpeg', 'png', 'webp')
+
+
+def is_image(filename):
+    return filename.rsplit('.', 1)[-1].lower() in EXTENSIONS
+
+
+# stored blobs have no extension, the type is read from the first bytes
+def sniff_mimetype(path):
+    with open(path, 'rb') as f:
+        head = f.read(12)
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG'):
+        return 'image/png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+# have the variants of a just stored image made in the background
+def queue_variants(sha256):
+    try:
+        current_app.task_queue.enqueue('app.tasks.make_image_variants', sha256)
+    except RedisError:
+        current_app.logger.warning('image variants not queued for %s', sha256, exc_info=True)
+
+
+def _open(path):
+    from PIL import Image, ImageOps
+    image = ImageOps.exif_transpose(Image.open(path))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def _encode(image, fmt):
+    out = io.BytesIO()
+    image.save(out, **FORMATS[fmt])
+    out.seek(0)
+    return out
+
+
+# (width, height, image) for each IMAGE_WIDTHS width narrower than the
+# original, and the original size
+def _resized(original):
+    from PIL import Image
+    widths = [w for w in current_app.config['IMAGE_WIDTHS'] if w < original.width]
+    for width in widths:
+        height = max(1, round(original.height * width / original.width))
+        yield width, height, original.resize((width, height), Image.LANCZOS)
+    yield original.width, original.height, original
+
+
+# render and record the variants of the stored image `sha256`; returns the
+# number made, 0 when they exist already (or another job made them first)
+def make_variants(sha256):
+    from app import uploads
+    from app.models import ImageVariant
+    if ImageVariant.query.filter_by(source=sha256).first() is not None:
+        return 0
+    made = 0
+    for width, height, image in _resized(_open(uploads.blob_path(sha256))):
+        for fmt in FORMATS:
+            data = _encode(image, fmt)
+            size = len(data.getbuffer())
+            db.session.add(ImageVariant(source=sha256, width=width, height=height, format=fmt,
+                                        sha256=uploads.store_stream(data), size=size))
+            made += 1
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # the blobs are content-addressed, the ones just written are the
+        # same files the other job recorded
+        db.session.rollback()
+        return 0
+    return made
+
+
+# "url 320w, url 640w, ..." per format for each stored image in `sources`
+def srcsets(sources):
+    from app.models import ImageVariant
+    sources = [source for source in set(sources) if source]
+    result = {source: {} for source in sources}
+    if not sources:
+        return result
+    variants = ImageVariant.query.filter(ImageVariant.source.in_(sources)).order_by(
+        ImageVariant.width)
+    for v in variants:
+        result[v.source].setdefault(v.format, []).append(
+            '{} {}w'.format(url_for('main.media', sha256=v.sha256), v.width))
+    return {source: {fmt: ', '.join(urls) for fmt, urls in formats.items()}
+            for source, formats in result.items()}
+
+
+# the same variants for images shipped in app/static, written once by
+# `flask static-image-variants` next to the original as
+# variants/<name>-<width>.<jpg|webp>
+def static_variants_dir():
+    return os.path.join(current_app.static_folder, 'variants')
+
+
+def make_static_variants(filename):
+    name = os.path.splitext(filename)[0]
+    os.makedirs(static_variants_dir(), exist_ok=True)
+    made = []
+    for width, _, image in _resized(_open(os.path.join(current_app.static_folder, filename))):
+        for fmt, ext in (('jpeg', 'jpg'), ('webp', 'webp')):
+            path = os.path.join(static_variants_dir(), '{}-{}.{}'.format(name, width, ext))
+            with open(path, 'wb') as f:
+                f.write(_encode(image, fmt).getvalue())
+            made.append(path)
+    _static_variants.clear()
+    return made
+
+
+# the directory is read once per worker and file
+_static_variants = {}
+
+
+# [(width, {'jpeg': url, 'webp': url}), ...] narrowest first
+def static_variants(filename):
+    if filename not in _static_variants:
+        _static_variants[filename] = _scan_static(filename)
+    return _static_variants[filename]
+
+
+# the srcset strings of static_variants(), as srcsets() gives them
+def static_srcsets(filename):
+    found = {}
+    for width, urls in static_variants(filename):
+        for fmt, url in urls.items():
+            found.setdefault(fmt, []).append('{} {}w'.format(url, width))
+    return {fmt: ', '.join(entries) for fmt, entries in found.items()}
+
+
+def _scan_static(filename):
+    name = os.path.splitext(filename)[0]
+    found = {}
+    try:
+        files = os.listdir(static_variants_dir())
+    except FileNotFoundError:
+        return []
+    for entry in files:
+        stem, ext = os.path.splitext(entry)
+        base, _, width = stem.rpartition('-')
+        if base != name or not width.isdigit():
+            continue
+        fmt = 'webp' if ext == '.webp' else 'jpeg'
+        found.setdefault(int(width), {})[fmt] = url_for('static', filename='variants/' + entry)
+    return sorted(found.items())
@@ -0,0 +1,141 @@
+import json
+from datetime import datetime, timedelta
+from flask import current_app
+from redis.exceptions import RedisError
+from sqlalchemy.exc import DataError, IntegrityError
+from app import db
+
+
+# write-behind buffer for the public forms (FORM_WRITE_BEHIND). A /contact
+# or /subscribe post only touches redis:
+#   ingest:seen:<kind>:<email>   set for FORM_SEEN_TTL, repeats are dropped here
+#   ingest:forms                 stream of accepted submissions
+#   ingest:dead                  submissions the database refused
+# and the RQ job app.tasks.flush_forms bulk-inserts them with
+# ON CONFLICT DO NOTHING against the unique email columns. The job is
+# scheduled with enqueue_in, so the worker runs with --with-scheduler.
+STREAM = 'ingest:forms'
+DEAD = 'ingest:dead'
+SEEN = 'ingest:seen:{}:{}'
+FLUSH_SCHEDULED = 'ingest:flush-scheduled'
+FLUSH_LOCK = 'ingest:flush-lock'
+FLUSH_LOCK_TIMEOUT = 300
+
+# add the submission unless its email was seen; 1 if added
+APPEND = """
+if not redis.call('set', KEYS[1], 1, 'NX', 'EX', ARGV[1]) then
+    return 0
+end
+redis.call('xadd', KEYS[2], 'MAXLEN', '~', ARGV[2], '*', 'kind', ARGV[3], 'data', ARGV[4])
+return 1
+"""
+
+
+def enabled():
+    return current_app.config['FORM_WRITE_BEHIND']
+
+
+# True if every given field fits its column, checked before anything is
+# buffered: one over-long value would fail the whole batch insert
+def fits(kind, **fields):
+    columns = _model(kind).__table__.c
+    for name, value in fields.items():
+        length = getattr(columns[name].type, 'length', None)
+        if value is not None and length is not None and len(value) > length:
+            return False
+    return True
+
+
+# queue a submission; False if the email was already taken in
+def record(kind, email, **fields):
+    redis = current_app.redis
+    append = redis.register_script(APPEND)
+    fields['email'] = email
+    fields['created'] = datetime.now().isoformat()
+    added = append(keys=[SEEN.format(kind, email), STREAM],
+                   args=[current_app.config['FORM_SEEN_TTL'],
+                         current_app.config['FORM_STREAM_MAXLEN'], kind, json.dumps(fields)])
+    if added and redis.set(FLUSH_SCHEDULED, 1, nx=True,
+                           ex=current_app.config['FORM_FLUSH_INTERVAL'] * 10):
+        current_app.task_queue.enqueue_in(
+            timedelta(seconds=current_app.config['FORM_FLUSH_INTERVAL']),
+            'app.tasks.flush_forms')
+    return bool(added)
+
+
+# write one submission straight away, for when the buffer is off or down;
+# False if the email is already in the table
+def insert(kind, email, **fields):
+    fields['email'] = email
+    fields['created'] = datetime.now()
+    added = _model(kind).insert_ignore_many([fields])
+    db.session.commit()
+    return added == 1
+
+
+# take in a form post; False if the email was already taken in
+def submit(kind, email, **fields):
+    email = email.strip().lower()
+    if enabled():
+        try:
+            return record(kind, email, **fields)
+        except RedisError:
+            current_app.logger.warning('form buffer unavailable', exc_info=True)
+    return insert(kind, email, **fields)
+
+
+def _model(kind):
+    from app.models import ContactUs, Subscribe
+    return {'contact': ContactUs, 'subscribe': Subscribe}[kind]
+
+
+# move buffered submissions into the database, batch_size at a time;
+# returns the number of stream entries processed
+def flush(batch_size=1000):
+    redis = current_app.redis
+    redis.delete(FLUSH_SCHEDULED)
+    lock = redis.lock(FLUSH_LOCK, timeout=FLUSH_LOCK_TIMEOUT, blocking_timeout=0)
+    if not lock.acquire():
+        return 0
+    try:
+        processed = 0
+        while True:
+            events = redis.xrange(STREAM, count=batch_size)
+            if not events:
+                break
+            rows = {'contact': {}, 'subscribe': {}}
+            for event_id, event in events:
+                data = json.loads(event[b'data'])
+                data['created'] = datetime.fromisoformat(data['created'])
+                # first submission of an email wins, as the table would have it
+                rows[event[b'kind'].decode('utf-8')].setdefault(data['email'], (event_id, data))
+            try:
+                for kind, by_email in rows.items():
+                    _model(kind).insert_ignore_many([data for _, data in by_email.values()])
+                db.session.commit()
+            except (DataError, IntegrityError):
+                db.session.rollback()
+                _insert_one_by_one(redis, rows)
+            redis.xdel(STREAM, *[event_id for event_id, _ in events])
+            processed += len(events)
+            # a long backlog must not outlive the lock
+            lock.extend(FLUSH_LOCK_TIMEOUT, replace_ttl=True)
+        return processed
+    finally:
+        lock.release()
+
+
+# a batch the database refused: insert what it takes, dead-letter the rest
+# so a bad entry cannot block the stream
+def _insert_one_by_one(redis, rows):
+    for kind, by_email in rows.items():
+        for event_id, data in by_email.values():
+            try:
+                _model(kind).insert_ignore_many([data])
+                db.session.commit()
+            except (DataError, IntegrityError) as e:
+                db.session.rollback()
+                current_app.logger.warning('form submission %s refused: %s', event_id, e.orig)
+                data['created'] = data['created'].isoformat()
+                redis.xadd(DEAD, {'id': event_id, 'kind': kind, 'data': json.dumps(data)},
+                           maxlen=current_app.config['FORM_STREAM_MAXLEN'], approximate=True)
@@ -0,0 +1,145 @@
+from datetime import timedelta
+from flask import current_app
+from app import db
+
+
+# write-behind buffer for likes (LIKE_WRITE_BEHIND). A click only touches
+# redis:
+#   likes:post:<id>:on / :off    users whose latest click was like / unlike
+#   likes:events                 stream of clicks, tells the flush which posts are dirty
+# and the RQ job app.tasks.flush_likes applies them to the likes table with
+# multi-row statements. While a flush runs, the sets being written sit in
+# :on:flushing / :off:flushing, and reads merge those too.
+EVENTS = 'likes:events'
+FLUSH_SCHEDULED = 'likes:flush-scheduled'
+FLUSH_LOCK = 'likes:flush-lock'
+FLUSH_LOCK_TIMEOUT = 300
+
+# move the pending sets of a post into its flushing sets; a click newer
+# than a half-done earlier flush wins over it
+TAKE_PENDING = """
+redis.call('sdiffstore', KEYS[3], KEYS[3], KEYS[2])
+redis.call('sdiffstore', KEYS[4], KEYS[4], KEYS[1])
+redis.call('sunionstore', KEYS[3], KEYS[3], KEYS[1])
+redis.call('sunionstore', KEYS[4], KEYS[4], KEYS[2])
+redis.call('del', KEYS[1], KEYS[2])
+return {redis.call('smembers', KEYS[3]), redis.call('smembers', KEYS[4])}
+"""
+
+
+def _keys(post_id):
+    base = 'likes:post:{}:'.format(post_id)
+    return base + 'on', base + 'off', base + 'on:flushing', base + 'off:flushing'
+
+
+def enabled():
+    return current_app.config['LIKE_WRITE_BEHIND']
+
+
+def record(user_id, post_id, liked):
+    on, off, _, _ = _keys(post_id)
+    pipe = current_app.redis.pipeline()
+    if liked:
+        pipe.srem(off, user_id)
+        pipe.sadd(on, user_id)
+    else:
+        pipe.srem(on, user_id)
+        pipe.sadd(off, user_id)
+    pipe.xadd(EVENTS, {'post': post_id, 'user': user_id, 'liked': int(liked)})
+    pipe.set(FLUSH_SCHEDULED, 1, nx=True, ex=current_app.config['LIKE_FLUSH_INTERVAL'] * 10)
+    scheduled = pipe.execute()[-1]
+    if scheduled:
+        current_app.task_queue.enqueue_in(
+            timedelta(seconds=current_app.config['LIKE_FLUSH_INTERVAL']),
+            'app.tasks.flush_likes')
+
+
+# {post_id: True/False} for posts where `user_id` has a click not yet in the db
+def pending_state(user_id, post_ids):
+    pipe = current_app.redis.pipeline(transaction=False)
+    for post_id in post_ids:
+        for key in _keys(post_id):
+            pipe.sismember(key, user_id)
+    flags = pipe.execute()
+    state = {}
+    for i, post_id in enumerate(post_ids):
+        on, off, on_flushing, off_flushing = flags[i * 4:i * 4 + 4]
+        if on or off:
+            state[post_id] = bool(on)
+        elif on_flushing or off_flushing:
+            state[post_id] = bool(on_flushing)
+    return state
+
+
+# {post_id: likes not yet counted in posts.like_count}; assumes every
+# pending click changes the user's state, exact again after the flush
+def pending_delta(post_ids):
+    pipe = current_app.redis.pipeline(transaction=False)
+    for post_id in post_ids:
+        for key in _keys(post_id):
+            pipe.scard(key)
+    sizes = pipe.execute()
+    delta = {}
+    for i, post_id in enumerate(post_ids):
+        on, off, on_flushing, off_flushing = sizes[i * 4:i * 4 + 4]
+        if on + on_flushing - off - off_flushing:
+            delta[post_id] = on + on_flushing - off - off_flushing
+    return delta
+
+
+# apply buffered clicks to the likes table, batch_size stream entries at a
+# time; returns the number of events processed
+def flush(batch_size=1000):
+    redis = current_app.redis
+    take_pending = redis.register_script(TAKE_PENDING)
+    redis.delete(FLUSH_SCHEDULED)
+    lock = redis.lock(FLUSH_LOCK, timeout=FLUSH_LOCK_TIMEOUT, blocking_timeout=0)
+    if not lock.acquire():
+        return 0
+    try:
+        return _flush(redis, take_pending, batch_size, lock)
+    finally:
+        lock.release()
+
+
+def _flush(redis, take_pending, batch_size, lock):
+    from app.models import Post, Like
+    processed = 0
+    while True:
+        events = redis.xrange(EVENTS, count=batch_size)
+        if not events:
+            break
+        post_ids = sorted({int(fields[b'post']) for _, fields in events})
+        taken = {post_id: take_pending(keys=_keys(post_id)) for post_id in post_ids}
+        # clicks on posts deleted in the meantime are dropped
+        existing = {post_id for post_id, in db.session.query(Post.id).filter(
+            Post.id.in_(post_ids))}
+
+        likes, unlikes = [], []
+        for post_id, (on, off) in taken.items():
+            if post_id not in existing:
+                continue
+            likes.extend((int(user_id), post_id) for user_id in on)
+            if off:
+                unlikes.append((post_id, [int(user_id) for user_id in off]))
+        Like.insert_ignore_many(likes)
+        for post_id, user_ids in unlikes:
+            db.session.connection().execute(Like.__table__.delete().where(db.and_(
+                Like.post_id == post_id, Like.user_id.in_(user_ids))))
+        # exact counts for the touched posts, one statement
+        Post.query.filter(Post.id.in_(post_ids)).update(
+            {Post.like_count: db.session.query(db.func.count(Like.id)).filter(
+                Like.post_id == Post.id).scalar_subquery()},
+            synchronize_session=False)
+        db.session.commit()
+
+        pipe = redis.pipeline()
+        for post_id in post_ids:
+            pipe.delete(*_keys(post_id)[2:])
+        pipe.xdel(EVENTS, *[event_id for event_id, _ in events])
+        pipe.execute()
+        processed += len(events)
+        # under steady traffic the loop may run for long: keep the lock
+        # so that no second flush overlaps this one
+        lock.extend(FLUSH_LOCK_TIMEOUT, replace_ttl=True)
+    return processed
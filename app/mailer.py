@@ -0,0 +1,126 @@
+import os
+import queue
+import smtplib
+import threading
+import time
+from app.exceptions import MailQueueFull
+
+
+# a refusal that will not change on retry
+def _permanent(exc):
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(exc, smtplib.SMTPResponseException) and exc.smtp_code >= 500
+
+
+# outgoing mail off the request worker: a bounded queue drained by
+# MAIL_WORKERS threads. A worker takes up to MAIL_BATCH_SIZE queued
+# messages and sends them over one SMTP connection; a dropped connection
+# or a 4xx reply reconnects and retries with exponential backoff. With no
+# workers configured the mail is sent inline.
+class MailQueue:
+    def __init__(self, app, mail):
+        self.app = app
+        self.mail = mail
+        self.workers = app.config['MAIL_WORKERS']
+        self.batch_size = app.config['MAIL_BATCH_SIZE']
+        self.retries = app.config['MAIL_RETRIES']
+        self.backoff = app.config['MAIL_RETRY_BACKOFF']
+        self.queue_timeout = app.config['MAIL_QUEUE_TIMEOUT']
+        self._queue = queue.Queue(app.config['MAIL_QUEUE_SIZE'])
+        self._pid = None
+        self._lock = threading.Lock()
+        self._counts = {'sent': 0, 'failed': 0, 'retried': 0}
+
+    def _ensure_workers(self):
+        # threads do not survive a fork, so every worker process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(self._queue.maxsize)
+                for _ in range(self.workers):
+                    threading.Thread(target=self._work, daemon=True).start()
+                self._pid = os.getpid()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._counts[name] += n
+
+    # messages waiting in this process
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, queued=self.depth(), workers=self.workers)
+
+    def send(self, msg):
+        if not self.workers:
+            self.send_batch([msg])
+            return
+        self._ensure_workers()
+        try:
+            self._queue.put(msg, timeout=self.queue_timeout)
+        except queue.Full:
+            raise MailQueueFull('mail queue is full')
+
+    # block until everything queued so far has been handled
+    def join(self):
+        self._queue.join()
+
+    def _work(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with self.app.app_context():
+                    self.send_batch(batch)
+            except Exception:
+                self.app.logger.error('mail delivery failed', exc_info=True)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    # send over one connection, returns the number of messages delivered.
+    # throttle() is called before each message; progress(n) after each of
+    # the first n messages is done with, delivered or given up on
+    def send_batch(self, messages, throttle=None, progress=None):
+        pending = list(messages)
+        sent = attempt = 0
+
+        def done():
+            pending.pop(0)
+            if progress is not None:
+                progress(len(messages) - len(pending))
+
+        while pending:
+            try:
+                with self.mail.connect() as conn:
+                    while pending:
+                        if throttle is not None:
+                            throttle()
+                        conn.send(pending[0])
+                        sent += 1
+                        attempt = 0
+                        done()
+            except (smtplib.SMTPException, OSError) as exc:
+                if not pending:
+                    # failed on QUIT, everything went out
+                    break
+                if _permanent(exc) or attempt >= self.retries:
+                    self.app.logger.error('mail to %s not delivered: %s',
+                                          pending[0].send_to, exc)
+                    self._count('failed')
+                    attempt = 0
+                    done()
+                    continue
+                self._count('retried')
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+        self._count('sent', sent)
+        return sent
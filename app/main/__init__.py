@@ -4,8 +4,9 @@ main = Blueprint('main', __name__)
 
 from . import views, errors
 from ..models import Permission
+from ..images import static_variants
 
 
 @main.app_context_processor
 def inject_permissions():
-    return dict(Permission=Permission)
+    return dict(Permission=Permission, static_variants=static_variants)
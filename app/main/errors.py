@@ -1,5 +1,6 @@
-from flask import render_template, request, jsonify
+from flask import render_template, request, jsonify, flash, make_response
 from . import main
+from ..exceptions import ValidationError, PasswordHashingBusy, MailQueueFull
 
 
 # http response code 403
@@ -28,3 +29,29 @@ def internal_server_error(e):
         response.status_code = 500
         return response
     return render_template('500.html'), 500
+
+
+# bad input in query args, e.g. a broken pagination cursor
+@main.app_errorhandler(ValidationError)
+def validation_error(e):
+    if request.accept_mimetypes.accept_json and \
+            not request.accept_mimetypes.accept_html:
+        response = jsonify({'error': 'bad request', 'message': e.args[0]})
+        response.status_code = 400
+        return response
+    flash(e.args[0], category='error')
+    return render_template('block.html'), 400
+
+
+# login/registration burst: the password hashing or mail queue is full
+@main.app_errorhandler(PasswordHashingBusy)
+@main.app_errorhandler(MailQueueFull)
+def password_hashing_busy(e):
+    if request.accept_mimetypes.accept_json and \
+            not request.accept_mimetypes.accept_html:
+        response = jsonify({'error': 'service unavailable'})
+        response.status_code = 503
+    else:
+        response = make_response(render_template('500.html'), 503)
+    response.headers['Retry-After'] = '1'
+    return response
@@ -1,13 +1,26 @@
 import os
+from time import time
+from datetime import datetime
+from uuid import uuid4
 from distutils.log import error
-from flask import render_template, request, redirect, url_for, flash, make_response, current_app
+from flask import render_template, request, redirect, url_for, flash, make_response, current_app, \
+    abort, jsonify, send_file, Response, stream_with_context
 from werkzeug.urls import url_parse
 from werkzeug.utils import secure_filename
+from flask_sqlalchemy import Pagination
 from flask_login import login_required, login_user, current_user, logout_user
 from . import main
-from .. import db
+from .. import db, ingest, uploads, images
+from ..pagination import keyset_paginate
+from ..cache import cached, add_cache_tags, invalidate, make_etag, not_modified, add_validators
+from ..search import add_to_index, remove_from_index, query_index, highlight
 from .forms import PostForm, CommentForm
-from ..models import Post, Subscribe, User, Comment, Permission, Like, ContactUs, MerchItem
+from ..models import Post, Subscribe, User, Comment, Permission, Like, ContactUs, MerchItem, Task, \
+    Upload
+from ..exports import FORMATS, find_export
+from ..progress import user_tasks
+from ..notifications import stream, acquire_stream, release_stream
+from redis.exceptions import RedisError
 from werkzeug.security import check_password_hash, generate_password_hash
 
 
@@ -15,7 +28,8 @@ from werkzeug.security import check_password_hash, generate_password_hash
 @main.route('/subscribe', methods=['POST'])
 def subscribe():
     if request.method == 'POST':
-        if len(request.form.get('email')) > 3:
+        if len(request.form.get('email')) > 3 and \
+                ingest.fits('subscribe', email=request.form.get('email').strip()):
             sub_cl = request.form.get('email')
             param = None
 
@@ -24,23 +38,15 @@ def subscribe():
             #     f.write(f'{sub_cl} \n ' )
             #     flash('You were successfully subscribe !')
 
-            # checking for subscription
-            if Subscribe.query.filter(Subscribe.email == f'{sub_cl}').all():
+            # buffered in redis, a repeated address is reported right away
+            if not ingest.submit('subscribe', sub_cl):
                 flash(" You are already subscribed ", category='info')
                 param = True
                 return render_template('block.html', param=param)
 
-            try:
-                # recording in the database
-                subscribe_m = Subscribe(email=sub_cl)
-                db.session.add(subscribe_m)
-                db.session.commit()
-                param = True
-                flash('You were successfully subscribe !', category='success')
-                return render_template('block.html', param=param)
-
-            except BaseException:
-                print('db error')
+            param = True
+            flash('You were successfully subscribe !', category='success')
+            return render_template('block.html', param=param)
         else:
             flash('Something wrong! Confirm your entries', category='error')
 
@@ -54,10 +60,9 @@ def contact():
     name = request.form.get('name')
     subject = request.form.get('subject')
     message = request.form.get('message')
-    if email and message:
-        new_contactus = ContactUs(name=name, email=email, subject=subject, message=message)
-        db.session.add(new_contactus)
-        db.session.commit()
+    if email and message and ingest.fits('contact', email=email.strip(), name=name,
+                                         subject=subject):
+        ingest.submit('contact', email, name=name, subject=subject, message=message)
         flash('You were successfully send message !', category='success')
     else:
         flash('Check your entries !', category='error')
@@ -105,13 +110,113 @@ def upload_file():
             flash('Chose correct file format(permitted jpg)', category='error')
 
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
-            flash('{"filename" : "%s"}' % filename, category='success')
+            # stored by content, a file uploaded twice is kept once
+            sha256 = uploads.store_stream(file.stream)
+            if images.is_image(file.filename):
+                images.queue_variants(sha256)
+            flash('{"filename" : "%s", "sha256" : "%s"}' % (secure_filename(file.filename), sha256),
+                  category='success')
 
     return render_template('upload.html')
 
 
+# chunked uploads: POST /uploads {filename, size} starts one, PUT
+# /uploads/<id>?offset=N sends the next chunk as the raw body, GET
+# /uploads/<id> tells a client where to resume, and POST
+# /uploads/<id>/finalize stores the file. Sizes are checked against the
+# declared Content-Length before any of the body is read.
+@main.route('/uploads', methods=['POST'])
+@login_required
+def start_upload():
+    data = request.get_json() or {}
+    filename = secure_filename(data.get('filename') or '')
+    size = data.get('size')
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'file type not allowed'}), 400
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({'error': 'size required'}), 400
+    if size > current_app.config['UPLOAD_MAX_SIZE']:
+        return jsonify({'error': 'file too large',
+                        'max_size': current_app.config['UPLOAD_MAX_SIZE']}), 413
+    upload = Upload(id=str(uuid4()), user_id=current_user.id, filename=filename, size=size)
+    db.session.add(upload)
+    db.session.commit()
+    response = jsonify(dict(upload.to_dict(), chunk_size=current_app.config['UPLOAD_CHUNK_SIZE']))
+    response.status_code = 201
+    response.headers['Location'] = url_for('main.upload_status', upload_id=upload.id)
+    return response
+
+
+@main.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    upload = Upload.query.filter_by(id=upload_id, user_id=current_user.id).first_or_404()
+    return jsonify(upload.to_dict())
+
+
+@main.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    upload = Upload.query.filter_by(id=upload_id, user_id=current_user.id).first_or_404()
+    offset = request.args.get('offset', type=int)
+    length = request.content_length
+    if upload.completed is not None:
+        return jsonify(dict(upload.to_dict(), error='upload already finalized')), 409
+    if length is None:
+        return jsonify({'error': 'Content-Length required'}), 411
+    if length > current_app.config['UPLOAD_CHUNK_SIZE'] or \
+            (offset or 0) + length > upload.size:
+        return jsonify({'error': 'chunk too large'}), 413
+    if offset != upload.received:
+        resume = 'resume at offset {}'.format(upload.received)
+        return jsonify(dict(upload.to_dict(), error=resume)), 409
+    # one writer per chunk: a concurrent retry of it is refused, not
+    # appended to the same partial file
+    if not upload.claim(offset):
+        return jsonify(dict(upload.to_dict(), error='chunk being written')), 409
+
+    try:
+        written = uploads.write_chunk(upload.id, offset, request.stream, length)
+    except Exception:
+        upload.release()
+        raise
+    if written != length:
+        upload.release()
+        return jsonify(dict(upload.to_dict(), error='incomplete chunk')), 400
+    if not upload.advance(offset, length):
+        return jsonify(dict(upload.to_dict(), error='conflicting chunk')), 409
+    return jsonify(upload.to_dict())
+
+
+@main.route('/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+def finalize_upload(upload_id):
+    upload = Upload.query.filter_by(id=upload_id, user_id=current_user.id).first_or_404()
+    if upload.completed is None:
+        if upload.received != upload.size:
+            return jsonify(dict(upload.to_dict(), error='upload incomplete')), 409
+        upload.sha256 = uploads.finalize(upload.id, upload.size)
+        upload.completed = datetime.utcnow()
+        db.session.commit()
+        if images.is_image(upload.filename):
+            images.queue_variants(upload.sha256)
+    return jsonify(upload.to_dict())
+
+
+# stored files by content hash; the url changes with the content, so it
+# can be cached for good
+@main.route('/media/<sha256>')
+def media(sha256):
+    if len(sha256) != 64 or not all(c in '0123456789abcdef' for c in sha256):
+        abort(404)
+    path = uploads.blob_path(sha256)
+    if not os.path.exists(path):
+        abort(404)
+    response = send_file(path, mimetype=images.sniff_mimetype(path), conditional=True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 # viewing messages from users from the "contact us" form
 @main.route('/contact/message', methods=['GET'])
 @login_required
@@ -125,7 +230,12 @@ def show_contact_msg():
             page = 1
 
         messages = ContactUs.query.order_by(ContactUs.created.desc())
-        pages = messages.paginate(page=page, per_page=5)  # create pagination page
+        # cursor pagination from the first page on; ?page=N still works
+        if 'page' not in request.args:
+            pages = keyset_paginate(ContactUs.query, ContactUs,
+                                    after=request.args.get('after'), per_page=5)
+        else:
+            pages = messages.paginate(page=page, per_page=5)  # create pagination page
 
         return render_template('messages_contact.html', messages=messages, pages=pages)
     return render_template('block.html')
@@ -143,7 +253,10 @@ def create_post():
             try:
                 post = Post(title=title, body=body, author_id=user_id)
                 db.session.add(post)   # add post in db
+                db.session.flush()
+                add_to_index(post)
                 db.session.commit()
+                invalidate('post-list')
             except BaseException:
                 print('error db.add 498e238e')
 
@@ -167,7 +280,10 @@ def edit_post(slug):
         if request.method == 'POST':
             form = PostForm(formdata=request.form, obj=post)
             form.populate_obj(post)
+            db.session.flush()
+            add_to_index(post)
             db.session.commit()
+            invalidate('post:%d' % post.id, 'post-list')
             return redirect(url_for('main.post_detail', slug=post.slug))
 
         form = PostForm(obj=post)
@@ -179,6 +295,7 @@ def edit_post(slug):
 
 # list titles of posts
 @main.route('/blog/posts', methods=['GET', 'POST'])
+@cached('post-list')
 def index():
     # search only among posts with "search?q="
     q = request.args.get('q')
@@ -190,15 +307,24 @@ def index():
     else:
         page = 1
 
+    snippets = {}
     if q:
-        posts = Post.query.filter(
-            Post.title.contains(q) | Post.body.contains(q))
+        # ranked full-text search, see app/search.py
+        ids, total, snippets = query_index(q, page, 5)
+        posts = Post.query.filter(Post.id.in_(ids))
+        found = {post.id: post for post in posts}
+        pages = Pagination(posts, page, 5, total, [found[i] for i in ids if i in found])
+    elif 'page' not in request.args:
+        # cursor pagination: /blog/posts, then ?after=<cursor>; ?page=N still works
+        posts = Post.query
+        pages = keyset_paginate(posts, Post, after=request.args.get('after'), per_page=5)
     else:
         posts = Post.query.order_by(Post.created.desc())
+        pages = posts.paginate(page=page, per_page=5)
+    feed = Post.preload_feed(pages.items, current_user)
 
-    pages = posts.paginate(page=page, per_page=5)
-
-    return render_template('index.html', posts=posts, pages=pages, page=page)
+    return render_template('index.html', posts=posts, pages=pages, page=page, feed=feed,
+                           snippets=snippets, highlight=highlight)
 
 
 # removal post by slag
@@ -212,8 +338,10 @@ def delete_post(slug):
             flash("Post does not exist.", category='error')
 
         else:
+            remove_from_index(post)
             db.session.delete(post)
             db.session.commit()
+            invalidate('post:%d' % post.id, 'post-list')
             flash('Post deleted.', category='success')
     else:
         flash('You do not have permission to delete this post.', category='error')
@@ -234,8 +362,10 @@ def delete_comment(comment_id):
     elif current_user.id != comment.author_id and current_user.id != comment.post.author_id:
         flash('You do not have permission to delete this comment.', category='error')
     else:
+        comment.post.bump_counter(Post.comment_count, -1)
         db.session.delete(comment)
         db.session.commit()
+        invalidate('post:%d' % comment.post_id, 'post-list')
         return redirect(url_for('main.post_detail', slug=slug))
     return redirect(url_for('main.index'))
 
@@ -250,11 +380,20 @@ def home_view():
 
 # detailed information about the post with comments
 @main.route('/post/<slug>/', methods=['GET', 'POST'])
+@cached()
 def post_detail(slug):
-    post_id = Post.query.filter(Post.slug == slug).first().id
-    post = Post.query.filter_by(id=post_id).first()
+    # one query for the post; a 304 needs nothing more
+    page = request.args.get('page', 1, type=int)
+    post = Post.load_detail(slug)
+    if post is None:
+        abort(404)
+    etag = make_etag(post.id, post.updated, current_user.get_id(), page)
+    response = not_modified(etag, post.updated)
+    if response:
+        return response
+
+    add_cache_tags('post:%d' % post.id)
     form = CommentForm()
-    page = request.args.get('page', type=int)
 
     if form.validate_on_submit():
         if post:
@@ -262,35 +401,38 @@ def post_detail(slug):
             comment = Comment(
                 body=form.body.data, author=current_user._get_current_object(), post=post,)
             db.session.add(comment)
+            post.bump_counter(Post.comment_count, 1)
             db.session.commit()
+            invalidate('post:%d' % post.id, 'post-list')
         else:
             flash('Post does not exist.', category='error')
             return redirect(url_for('main.index'))
-    if page:
-        page = int(page)
-    else:
-        page = 1
     pagination_lim = 3
-    comments = Comment.query.order_by(Comment.timestamp.desc())
-    pages = comments.paginate(page=page, per_page=5)
+    pages = post.comment_page(page, current_app.config['FLASKY_COMMENTS_PER_PAGE'])
+    comments = pages.items
 
-    return render_template('post_d.html', post=post,
-                           comments=comments, page=page, pages=pages, form=form,
-                           pagination_lim=pagination_lim)
+    response = make_response(render_template('post_d.html', post=post,
+                                             comments=comments, page=page, pages=pages,
+                                             form=form, pagination_lim=pagination_lim))
+    return add_validators(response, make_etag(post.id, post.updated, current_user.get_id(), page),
+                          post.updated)
 
 
-# like/ulike post
-@main.route('/like/<int:post_id>/<action>')
+# like/ulike post; answers JSON with the new count to fetch() callers,
+# plain links still get redirected back
+@main.route('/like/<int:post_id>/<action>', methods=['GET', 'POST'])
 @login_required
 def like_action(post_id, action):
     post = Post.query.filter_by(id=post_id).first_or_404()
-    if action == 'like':
-        current_user.like_post(post)
-        db.session.commit()
-    if action == 'unlike':
-        current_user.unlike_post(post)
-        db.session.commit()
-    return redirect(request.referrer)
+    if action not in ('like', 'unlike'):
+        abort(404)
+    current_user.toggle_like(post, action == 'like')
+    invalidate('post:%d' % post.id, 'post-list')
+    if request.accept_mimetypes.accept_json and \
+            not request.accept_mimetypes.accept_html:
+        return jsonify({'post_id': post.id, 'liked': action == 'like',
+                        'likes': Post.preload_feed([post]).like_count(post)})
+    return redirect(request.referrer or url_for('main.index'))
 
 
 # help page
@@ -309,9 +451,64 @@ def user_profile(id):
 @main.route('/export_posts')
 @login_required
 def export_posts():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        fmt = 'ndjson'
     if current_user.get_task_in_progress('export_posts'):
         flash('An export task is currently in progress')
     else:
-        current_user.launch_task('export_posts', ('Exporting posts...'))
+        current_user.launch_task('export_posts', ('Exporting posts...'), fmt)
         db.session.commit()
     return redirect(url_for('main.index', username=current_user.username))
+
+
+# finished export of the current user's posts, streamed from disk
+@main.route('/export_posts/<task_id>/download')
+@login_required
+def download_export(task_id):
+    Task.query.filter_by(id=task_id, user_id=current_user.id).first_or_404()
+    export = find_export(task_id)
+    if export is None:
+        abort(404)
+    path, fmt = export
+    return send_file(path, mimetype='application/gzip', as_attachment=True,
+                     attachment_filename='posts.{}.gz'.format(fmt))
+
+
+# progress of all the current user's recent tasks in one redis read; the
+# database is only asked when redis is down
+@main.route('/tasks/status')
+@login_required
+def tasks_status():
+    try:
+        tasks = user_tasks(current_user.id)
+    except RedisError:
+        tasks = {task.id: {'name': task.name, 'description': task.description,
+                           'progress': None, 'state': 'running'}
+                 for task in current_user.get_tasks_in_progress()}
+    return jsonify({'tasks': tasks})
+
+
+# server-sent events with the current user's notifications, read by
+# static/notifications.js; a reconnecting EventSource sends the last
+# timestamp it saw as Last-Event-ID
+@main.route('/notifications/stream')
+@login_required
+def notifications_stream():
+    if not acquire_stream():
+        response = jsonify({'message': 'too many open streams'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    since = request.headers.get('Last-Event-ID', type=float) or \
+        request.args.get('since', time(), type=float)
+    user = current_user._get_current_object()
+    body = stream(user.id, since,
+                  lambda since: [n.to_dict() for n in user.get_notifications(since)],
+                  timeout=current_app.config['NOTIFICATION_STREAM_TIMEOUT'],
+                  heartbeat=current_app.config['NOTIFICATION_HEARTBEAT'])
+    response = Response(stream_with_context(body), mimetype='text/event-stream')
+    response.call_on_close(release_stream)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
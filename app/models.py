@@ -5,13 +5,17 @@ import rq
 import redis
 import json
 from time import time
-from flask import current_app, request, url_for
+from flask import current_app, request, url_for, has_app_context
 from enum import unique
 from app.exceptions import ValidationError
 from datetime import datetime, timedelta
 from flask_login import UserMixin
-from app import db, login
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask_sqlalchemy import Pagination
+from app import db, login, likes, progress, notifications
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm import make_transient_to_detached, object_session
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 
 
 # create tag for post
@@ -23,7 +27,13 @@ post_tags = db.Table(
 
 @login.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    data = current_app.user_cache.get(user_id)
+    if data is not None:
+        return User.from_cache(data)
+    user = User.query.get(int(user_id))
+    if user is not None:
+        current_app.user_cache.set(user_id, user.principal_data())
+    return user
 
 
 # premission for users(role_id)
@@ -89,6 +99,12 @@ class Role(db.Model):
         return '<Role %r>' % self.name
 
 
+# url_for an endpoint taking `id`, as a str.format template
+def url_template(endpoint):
+    sentinel = 918273645
+    return url_for(endpoint, id=sentinel).replace(str(sentinel), '{}')
+
+
 # create slug for post
 def slugify(stringg):
     pattern = r'[^\w+]'
@@ -123,29 +139,63 @@ class User(UserMixin, db.Model):
             if self.role is None:
                 self.role = Role.query.filter_by(default=True).first()
 
+    # one INSERT ... ON CONFLICT DO NOTHING; True if the like is new
     def like_post(self, post):
-        if not self.has_liked_post(post):
-            like = Like(user_id=self.id, post_id=post.id)
-            db.session.add(like)
+        inserted = Like.insert_ignore(self.id, post.id)
+        if inserted:
+            post.bump_counter(Post.like_count, 1)
+        return inserted
+
+    # like or unlike and commit; with LIKE_WRITE_BEHIND only recorded in
+    # redis, for app.tasks.flush_likes to write
+    def toggle_like(self, post, liked):
+        if likes.enabled():
+            likes.record(self.id, post.id, liked)
+            return
+        if liked:
+            self.like_post(post)
+        else:
+            self.unlike_post(post)
+        db.session.commit()
 
+    # one DELETE; True if there was a like to remove
     def unlike_post(self, post):
-        if self.has_liked_post(post):
-            Like.query.filter_by(
-                user_id=self.id,
-                post_id=post.id).delete()
+        deleted = Like.query.filter_by(
+            user_id=self.id,
+            post_id=post.id).delete()
+        if deleted:
+            post.bump_counter(Post.like_count, -deleted)
+        return deleted > 0
 
     def has_liked_post(self, post):
         return Like.query.filter(
             Like.user_id == self.id,
             Like.post_id == post.id).count() > 0
 
+    # ids of the given posts liked by this user, in a single query
+    def liked_post_ids(self, post_ids):
+        if not post_ids:
+            return set()
+        rows = db.session.query(Like.post_id).filter(
+            Like.user_id == self.id,
+            Like.post_id.in_(post_ids))
+        return {post_id for post_id, in rows}
+
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = current_app.password_hasher.hash(password)
 
+    # on success a legacy or too cheap hash is replaced, the caller commits
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        matches, new_hash = current_app.password_hasher.verify(password, self.password_hash)
+        if matches and new_hash:
+            self.password_hash = new_hash
+        return matches
 
     def can(self, perm):
+        # users loaded from the principal cache carry their role's bitmask
+        permissions = getattr(self, '_permissions', None)
+        if permissions is not None:
+            return permissions & perm == perm
         return self.role is not None and self.role.has_permission(perm)
 
     def is_administrator(self):
@@ -173,6 +223,7 @@ class User(UserMixin, db.Model):
         now = datetime.utcnow()
         if self.token and self.token_expiration > now + timedelta(seconds=90):
             return self.token
+        evict_on_commit('token_cache', self.token)
         self.token = base64.b64encode(os.urandom(24)).decode('utf-8')
         self.token_expiration = now + timedelta(seconds=expires_in)
         db.session.add(self)
@@ -180,27 +231,74 @@ class User(UserMixin, db.Model):
 
     def revoke_token(self):
         self.token_expiration = datetime.utcnow() - timedelta(seconds=1)
+        evict_on_commit('token_cache', self.token)
 
     @staticmethod
     def check_token(token):
-        user = User.query.filter_by(token=token).first()
+        data = current_app.token_cache.get(token)
+        if data is not None:
+            user = User.from_cache(data)
+        else:
+            user = User.query.filter_by(token=token).first()
+            if user is not None and user.token_expiration > datetime.utcnow():
+                current_app.token_cache.set(token, user.cache_data())
         if user is None or user.token_expiration < datetime.utcnow():
             return None
         return user
 
+    # columns kept in the auth caches (no password hash); the rest of the
+    # row is loaded from the database only if it is used
+    cached_columns = ('id', 'email', 'username', 'last_seen', 'active', 'role_id',
+                      'token', 'token_expiration')
+
+    def cache_data(self):
+        data = {}
+        for name in self.cached_columns:
+            value = getattr(self, name)
+            data[name] = value.isoformat() if isinstance(value, datetime) else value
+        return data
+
+    # cache_data() plus the effective permission bitmask of the user's role
+    def principal_data(self):
+        data = self.cache_data()
+        data['permissions'] = self.role.permissions if self.role is not None else 0
+        return data
+
+    # a persistent User rebuilt from cache_data() without a query
+    @staticmethod
+    def from_cache(data):
+        user = User.__mapper__.class_manager.new_instance()
+        for name in User.cached_columns:
+            value = data.get(name)
+            if value is not None and isinstance(User.__table__.c[name].type, db.DateTime):
+                value = datetime.fromisoformat(value)
+            set_committed_value(user, name, value)
+        make_transient_to_detached(user)
+        user = db.session.merge(user, load=False)
+        if 'permissions' in data:
+            user._permissions = data['permissions']
+        return user
+
     # tasks
     def add_notification(self, name, data):
         self.notifications.filter_by(name=name).delete()
-        n = Notification(name=name, payload_json=json.dumps(data), user=self)
+        n = Notification(name=name, payload_json=json.dumps(data), user=self,
+                         timestamp=time())
         db.session.add(n)
+        notifications.publish_on_commit(n.to_dict())
         return n
 
+    def get_notifications(self, since=0, limit=100):
+        return self.notifications.filter(Notification.timestamp > since).order_by(
+            Notification.timestamp.asc()).limit(limit).all()
+
     def launch_task(self, name, description, *args, **kwargs):
         rq_job = current_app.task_queue.enqueue('app.tasks.' + name, self.id,
                                                 *args, **kwargs)
         task = Task(id=rq_job.get_id(), name=name, description=description,
-                    user=self)
+                    user_id=self.id)
         db.session.add(task)
+        progress.register(task)
         return task
 
     def get_tasks_in_progress(self):
@@ -214,14 +312,66 @@ class User(UserMixin, db.Model):
         return '<User: {}>'.format(self.username)
 
 
+# auth cache entries to drop once the session commits; dropped earlier, a
+# concurrent request could cache the old row again before the change is
+# visible. `key` EVICT_ALL empties the cache.
+EVICT_ALL = '*'
+
+
+def evict_on_commit(cache_name, key, session=None):
+    if key is None:
+        return
+    session = session or db.session()
+    session.info.setdefault('cache_evictions', set()).add((cache_name, key))
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _evict_committed(session):
+    for cache_name, key in session.info.pop('cache_evictions', ()):
+        cache = getattr(current_app, cache_name)
+        if key == EVICT_ALL:
+            cache.evict_all()
+        else:
+            cache.evict(key)
+
+
+@db.event.listens_for(db.session, 'after_soft_rollback')
+def _discard_evictions(session, previous_transaction):
+    # a savepoint rolled back leaves the outer transaction's changes
+    if not previous_transaction.nested:
+        session.info.pop('cache_evictions', None)
+
+
+# cached principals must not outlive changes to the user row or to roles;
+# these fire at flush, the eviction itself waits for the commit
+@db.event.listens_for(User, 'after_update')
+@db.event.listens_for(User, 'after_delete')
+def evict_cached_user(mapper, connection, target):
+    if has_app_context():
+        evict_on_commit('user_cache', str(target.id), object_session(target))
+
+
+@db.event.listens_for(Role, 'after_insert')
+@db.event.listens_for(Role, 'after_update')
+@db.event.listens_for(Role, 'after_delete')
+def evict_cached_users(mapper, connection, target):
+    if has_app_context():
+        evict_on_commit('user_cache', EVICT_ALL, object_session(target))
+
+
 class Post(db.Model):
     __tablename__ = 'posts'
+    __table_args__ = (db.Index('ix_posts_created_id', 'created', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(140))
     slug = db.Column(db.String(140), unique=True)
     body = db.Column(db.Text)
     created = db.Column(db.DateTime, default=datetime.now)
+    # utc, bumped by every UPDATE of the row (counters included); used for ETag/Last-Modified
+    updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     author_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     likes = db.relationship('Like', backref='post', passive_deletes=True, lazy='dynamic')
     comments = db.relationship('Comment', backref='post', lazy='dynamic', passive_deletes=True)
 
@@ -240,6 +390,75 @@ class Post(db.Model):
         if self.title:
             self.slug = slugify(self.title)
 
+    # atomic "counter = counter + delta" in the current transaction
+    def bump_counter(self, column, delta):
+        Post.query.filter_by(id=self.id).update(
+            {column: column + delta}, synchronize_session=False)
+        db.session.expire(self, [column.key])
+
+    # like counts for a page of posts, one grouped query
+    @staticmethod
+    def like_counts(post_ids):
+        if not post_ids:
+            return {}
+        rows = db.session.query(Like.post_id, db.func.count(Like.id)).filter(
+            Like.post_id.in_(post_ids)).group_by(Like.post_id)
+        return dict(rows)
+
+    # comment counts for a page of posts, one grouped query
+    @staticmethod
+    def comment_counts(post_ids):
+        if not post_ids:
+            return {}
+        rows = db.session.query(Comment.post_id, db.func.count(Comment.id)).filter(
+            Comment.post_id.in_(post_ids)).group_by(Comment.post_id)
+        return dict(rows)
+
+    # like state of a whole page of posts for the posts list, with clicks
+    # still buffered in redis merged in (LIKE_WRITE_BEHIND)
+    @staticmethod
+    def preload_feed(posts, user=None):
+        post_ids = [post.id for post in posts]
+        liked = set()
+        authenticated = user is not None and user.is_authenticated
+        if authenticated:
+            liked = user.liked_post_ids(post_ids)
+        delta = {}
+        if likes.enabled() and post_ids:
+            if authenticated:
+                for post_id, state in likes.pending_state(user.id, post_ids).items():
+                    if state:
+                        liked.add(post_id)
+                    else:
+                        liked.discard(post_id)
+            delta = likes.pending_delta(post_ids)
+        return FeedState(liked=liked, delta=delta)
+
+    # fix drifted like/comment counters, walking the posts by id in batches
+    @staticmethod
+    def reconcile_counters(batch_size=500):
+        fixed = 0
+        last_id = 0
+        while True:
+            batch = db.session.query(Post.id, Post.like_count, Post.comment_count).filter(
+                Post.id > last_id).order_by(Post.id).limit(batch_size).all()
+            if not batch:
+                break
+            post_ids = [row.id for row in batch]
+            likes = Post.like_counts(post_ids)
+            comments = Post.comment_counts(post_ids)
+            for row in batch:
+                like_count = likes.get(row.id, 0)
+                comment_count = comments.get(row.id, 0)
+                if row.like_count != like_count or row.comment_count != comment_count:
+                    Post.query.filter_by(id=row.id).update(
+                        {Post.like_count: like_count, Post.comment_count: comment_count},
+                        synchronize_session=False)
+                    fixed += 1
+            db.session.commit()
+            last_id = post_ids[-1]
+        return fixed
+
     def to_json(self):
         json_post = {
             'url': url_for('api.get_post', id=self.id),
@@ -247,11 +466,43 @@ class Post(db.Model):
             'body_html': self.body,
             'timestamp': self.created,
             'author_url': url_for('api.get_user', id=self.author_id),
-            'comment_count': self.comments.count(),
-            'likes': self.likes.count()
+            'comment_count': self.comment_count,
+            'likes': self.like_count
         }
         return json_post
 
+    # the post detail page's post, with its tags, in one query
+    @staticmethod
+    def load_detail(slug):
+        return Post.query.options(db.joinedload(Post.tags)).filter(
+            Post.slug == slug).first()
+
+    # one page of this post's comments, newest first, authors joined in;
+    # the total comes from comment_count, so there is no COUNT(*)
+    def comment_page(self, page, per_page):
+        items = Comment.query.options(db.joinedload(Comment.author)).filter(
+            Comment.post_id == self.id).order_by(
+            Comment.timestamp.desc(), Comment.id.desc()).limit(per_page).offset(
+            (page - 1) * per_page).all()
+        return Pagination(None, page, per_page, self.comment_count, items)
+
+    # to_json for a whole page: urls are formatted from templates built once
+    # and the counters come with the rows, so no query or url_for per post
+    @staticmethod
+    def iter_json(posts):
+        post_url = url_template('api.get_post')
+        author_url = url_template('api.get_user')
+        for post in posts:
+            yield {
+                'url': post_url.format(post.id),
+                'body': post.body,
+                'body_html': post.body,
+                'timestamp': post.created,
+                'author_url': author_url.format(post.author_id),
+                'comment_count': post.comment_count,
+                'likes': post.like_count
+            }
+
     @staticmethod
     def from_json(json_post):
         body = json_post.get('body')
@@ -263,6 +514,19 @@ class Post(db.Model):
         return '<Post id: {}, title: {}>'.format(self.id, self.title)
 
 
+# preloaded like state of a page of posts, used by the posts list template
+class FeedState:
+    def __init__(self, liked=None, delta=None):
+        self.liked = liked or set()
+        self.delta = delta or {}
+
+    def has_liked(self, post):
+        return post.id in self.liked
+
+    def like_count(self, post):
+        return max(post.like_count + self.delta.get(post.id, 0), 0)
+
+
 class Tag(db.Model):
     __tablename__ = 'tags'
     id = db.Column(db.Integer, primary_key=True)
@@ -277,6 +541,69 @@ class Tag(db.Model):
         return '{}'.format(self.name)
 
 
+# chunked upload of one file, see app/uploads.py; sha256 names the stored
+# content once finalized
+class Upload(db.Model):
+    __tablename__ = 'uploads'
+    id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    filename = db.Column(db.String(128))
+    size = db.Column(db.BigInteger)
+    received = db.Column(db.BigInteger, default=0)
+    sha256 = db.Column(db.String(64), index=True)
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+    completed = db.Column(db.DateTime)
+    # set while a request writes the chunk at `received`
+    claimed = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {'id': self.id, 'filename': self.filename, 'size': self.size,
+                'received': self.received, 'sha256': self.sha256,
+                'complete': self.completed is not None}
+
+    # take the chunk at `offset` for this request, one conditional UPDATE;
+    # False when another request is writing it or moved the upload on. A
+    # claim older than UPLOAD_CLAIM_TIMEOUT is left by a dead request.
+    def claim(self, offset):
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=current_app.config['UPLOAD_CLAIM_TIMEOUT'])
+        updated = Upload.query.filter(
+            Upload.id == self.id, Upload.received == offset,
+            db.or_(Upload.claimed.is_(None), Upload.claimed < stale)).update(
+            {Upload.claimed: now}, synchronize_session=False)
+        db.session.commit()
+        return updated == 1
+
+    def release(self):
+        Upload.query.filter_by(id=self.id).update({Upload.claimed: None},
+                                                  synchronize_session=False)
+        db.session.commit()
+
+    # record `length` more bytes at the claimed `offset`; False when the
+    # claim went stale and another request moved the upload on
+    def advance(self, offset, length):
+        updated = Upload.query.filter_by(id=self.id, received=offset).update(
+            {Upload.received: offset + length, Upload.claimed: None},
+            synchronize_session=False)
+        db.session.commit()
+        db.session.refresh(self)
+        return updated == 1
+
+
+# resized copy of a stored image, see app/images.py
+class ImageVariant(db.Model):
+    __tablename__ = 'image_variants'
+    __table_args__ = (db.UniqueConstraint('source', 'width', 'format',
+                                          name='uq_image_variants_source_width_format'),)
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(64), nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    format = db.Column(db.String(8), nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.Integer)
+
+
 class Task(db.Model):
     __tablename__ = 'tasks'
     id = db.Column(db.String(36), primary_key=True)
@@ -292,13 +619,23 @@ class Task(db.Model):
             return None
         return rq_job
 
+    # running progress is kept in redis only, see app/progress.py
     def get_progress(self):
-        job = self.get_rq_job()
-        return job.meta.get('progress', 0) if job is not None else 100
+        if self.complete:
+            return 100
+        try:
+            value = progress.task_progress(self.user_id, self.id)
+        except redis.exceptions.RedisError:
+            return 0
+        if value is None:
+            # entry expired: a job that is gone as well has ended
+            return 0 if self.get_rq_job() is not None else 100
+        return value
 
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (db.Index('ix_notifications_user_id_timestamp', 'user_id', 'timestamp'),)
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
@@ -308,6 +645,10 @@ class Notification(db.Model):
     def get_data(self):
         return json.loads(str(self.payload_json))
 
+    def to_dict(self):
+        return {'name': self.name, 'user_id': self.user_id or self.user.id,
+                'timestamp': self.timestamp, 'data': self.get_data()}
+
 
 # Subscribe get news in a home page
 class Subscribe(db.Model):
@@ -316,10 +657,77 @@ class Subscribe(db.Model):
     email = db.Column(db.String(64), unique=True)
     time = db.Column(db.DateTime, default=datetime.now)
 
+    # rows of email and created; returns the number of subscribers added
+    @staticmethod
+    def insert_ignore_many(rows):
+        return insert_ignore(Subscribe.__table__, [
+            {'email': row['email'], 'time': row['created']} for row in rows], ['email'])
+
+
+# newsletter sent to every Subscribe row, see app/newsletter.py
+class Campaign(db.Model):
+    __tablename__ = 'campaigns'
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(128))
+    body = db.Column(db.Text)
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+    # subscribers up to this id have been split into chunks
+    planned_through = db.Column(db.Integer, default=0)
+    planned = db.Column(db.Boolean, default=False)
+    finished = db.Column(db.DateTime)
+    chunks = db.relationship('CampaignChunk', backref='campaign', lazy='dynamic')
+
+    # subscribers mailed or given up on so far
+    def processed_count(self):
+        return db.session.query(db.func.coalesce(db.func.sum(CampaignChunk.processed), 0)).filter(
+            CampaignChunk.campaign_id == self.id).scalar()
+
+
+# subscribers first_id..last_id of a campaign, mailed by one RQ job;
+# sent_through is the checkpoint a restarted job resumes after
+class CampaignChunk(db.Model):
+    __tablename__ = 'campaign_chunks'
+    __table_args__ = (db.Index('ix_campaign_chunks_campaign_id_finished',
+                               'campaign_id', 'finished'),)
+    id = db.Column(db.Integer, primary_key=True)
+    campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.id'))
+    first_id = db.Column(db.Integer)
+    last_id = db.Column(db.Integer)
+    sent_through = db.Column(db.Integer)
+    processed = db.Column(db.Integer, default=0)
+    finished = db.Column(db.Boolean, default=False)
+
+
+# calendar event, shown on the days from start to end
+class Event(db.Model):
+    __tablename__ = 'events'
+    __table_args__ = (db.Index('ix_events_start_end', 'start', 'end'),)
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(140), nullable=False)
+    description = db.Column(db.Text)
+    start = db.Column(db.DateTime, nullable=False)
+    end = db.Column(db.DateTime, nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # events overlapping the days first..last, one range scan of ix_events_start_end
+    @staticmethod
+    def in_range(first, last):
+        since = datetime.combine(first, datetime.min.time())
+        until = datetime.combine(last + timedelta(days=1), datetime.min.time())
+        events = Event.query.filter(Event.start < until, Event.end >= since)
+        return events.order_by(Event.start, Event.id).all()
+
+    # start and end are wall-clock times of the calendar, not UTC
+    def to_dict(self):
+        return {'id': self.id, 'title': self.title, 'description': self.description,
+                'start': self.start.isoformat(), 'end': self.end.isoformat()}
+
 
 # comments for post
 class Comment(db.Model):
     __tablename__ = 'comments'
+    __table_args__ = (db.Index('ix_comments_post_id_timestamp', 'post_id', 'timestamp'),)
     id = db.Column(db.Integer, primary_key=True)
     body = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
@@ -328,18 +736,60 @@ class Comment(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete="CASCADE"), nullable=False)
 
 
+# one multi-row INSERT ... ON CONFLICT DO NOTHING on the unique `columns`
+# (postgres, sqlite), row by row in savepoints elsewhere; returns the
+# number of rows added
+def insert_ignore(table, rows, columns):
+    if not rows:
+        return 0
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        stmt = postgresql.insert(table).values(rows).on_conflict_do_nothing(
+            index_elements=columns)
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(table).values(rows).on_conflict_do_nothing()
+    else:
+        added = 0
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.connection().execute(table.insert().values(**row))
+                added += 1
+            except IntegrityError:
+                pass
+        return added
+    return db.session.connection().execute(stmt).rowcount
+
+
 # likes for post
 class Like(db.Model):
     __tablename__ = 'likes'
+    __table_args__ = (db.UniqueConstraint('user_id', 'post_id', name='uq_likes_user_post'),)
     id = db.Column(db.Integer, primary_key=True)
     date_created = db.Column(db.DateTime(timezone=True), default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
-    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete="CASCADE"), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id', ondelete="CASCADE"),
+                        nullable=False, index=True)
+
+    # insert the like unless (user_id, post_id) exists; True if a row was added
+    @staticmethod
+    def insert_ignore(user_id, post_id):
+        return Like.insert_ignore_many([(user_id, post_id)]) == 1
+
+    # one multi-row INSERT ... ON CONFLICT DO NOTHING of (user_id, post_id)
+    # pairs; returns the number of likes added
+    @staticmethod
+    def insert_ignore_many(pairs):
+        now = datetime.utcnow()
+        rows = [{'user_id': user_id, 'post_id': post_id, 'date_created': now}
+                for user_id, post_id in pairs]
+        return insert_ignore(Like.__table__, rows, ['user_id', 'post_id'])
 
 
 # contack us form in a home page
 class ContactUs(db.Model):
     __tablename__ = 'contuct_us'
+    __table_args__ = (db.Index('ix_contuct_us_created_id', 'created', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     created = db.Column(db.DateTime, default=datetime.now)
     name = db.Column(db.String(50))
@@ -347,13 +797,75 @@ class ContactUs(db.Model):
     subject = db.Column(db.String(50))
     message = db.Column(db.Text)
 
+    # rows of name, email, subject, message and created; returns the
+    # number of messages added
+    @staticmethod
+    def insert_ignore_many(rows):
+        return insert_ignore(ContactUs.__table__, [
+            {key: row.get(key) for key in ('created', 'name', 'email', 'subject', 'message')}
+            for row in rows], ['email'])
+
 
 # sales items
 class MerchItem(db.Model):
     __tablename__ = 'merch_item'
+    __table_args__ = (db.Index('ix_merch_item_created_id', 'created', 'id'),
+                      db.CheckConstraint('stock >= 0', name='ck_merch_item_stock'))
     id = db.Column(db.Integer, primary_key=True)
     created = db.Column(db.DateTime, default=datetime.now)
+    # utc, bumped by every UPDATE of the row (stock included); part of the shop ETag
+    updated = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     name = db.Column(db.String(50), nullable=False, unique=True)
     description = db.Column(db.Text, nullable=False)
     price = db.Column(db.Integer, default=0)
     active = db.Column(db.Boolean(), default=True)
+    # sha256 of the picture in the upload store
+    image = db.Column(db.String(64))
+    # units left; only changed by conditional UPDATEs, see app/orders.py
+    stock = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # take `quantity` units if that many are left; one atomic statement,
+    # so concurrent buyers can never take the same unit
+    @staticmethod
+    def reserve(item_id, quantity=1):
+        return MerchItem.query.filter(
+            MerchItem.id == item_id, MerchItem.active.is_(True),
+            MerchItem.stock >= quantity).update(
+            {MerchItem.stock: MerchItem.stock - quantity}, synchronize_session=False) == 1
+
+    @staticmethod
+    def release(item_id, quantity=1):
+        MerchItem.query.filter_by(id=item_id).update(
+            {MerchItem.stock: MerchItem.stock + quantity}, synchronize_session=False)
+
+
+# a purchase of a merch item; the unit is reserved when the order is taken
+# and the RQ job app.tasks.process_order confirms it or gives it back
+class Order(db.Model):
+    __tablename__ = 'orders'
+    __table_args__ = (db.UniqueConstraint('user_id', 'idempotency_key',
+                                          name='uq_orders_user_idempotency_key'),
+                      db.Index('ix_orders_status_created', 'status', 'created'))
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('merch_item.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    price = db.Column(db.Integer)
+    status = db.Column(db.String(16), nullable=False, default='reserved')
+    idempotency_key = db.Column(db.String(64), nullable=False)
+    created = db.Column(db.DateTime, default=datetime.utcnow)
+    processed = db.Column(db.DateTime)
+    item = db.relationship('MerchItem')
+    user = db.relationship('User')
+
+    def to_dict(self):
+        return {'id': self.id, 'item_id': self.item_id, 'quantity': self.quantity,
+                'price': self.price, 'status': self.status,
+                'url': url_for('sales.order_status', order_id=self.id)}
+
+    # move from `current` to `status` unless another worker did first
+    def transition(self, current, status):
+        updated = Order.query.filter_by(id=self.id, status=current).update(
+            {Order.status: status, Order.processed: datetime.utcnow()},
+            synchronize_session=False)
+        return updated == 1
@@ -0,0 +1,103 @@
+import time
+from datetime import datetime
+from flask import current_app, render_template
+from flask_mail import Message
+from app import db
+from app.models import Campaign, CampaignChunk, Subscribe
+
+
+# a newsletter goes out as one RQ job per chunk of NEWSLETTER_CHUNK_SIZE
+# subscribers, split in id order by app.tasks.plan_campaign. A chunk job
+# renders the mail once, sends it over one SMTP connection and checkpoints
+# the last subscriber id done every NEWSLETTER_CHECKPOINT messages, so a
+# campaign that died half way is resumed, not restarted.
+RATE_KEY = 'newsletter:rate:{}'
+
+
+def launch(subject, body):
+    campaign = Campaign(subject=subject, body=body)
+    db.session.add(campaign)
+    db.session.commit()
+    current_app.task_queue.enqueue('app.tasks.plan_campaign', campaign.id)
+    return campaign
+
+
+# queue whatever a crashed campaign has left: the rest of the planning and
+# every chunk not finished
+def resume(campaign):
+    if not campaign.planned:
+        current_app.task_queue.enqueue('app.tasks.plan_campaign', campaign.id)
+    for chunk in campaign.chunks.filter_by(finished=False):
+        current_app.task_queue.enqueue('app.tasks.send_campaign_chunk', chunk.id)
+
+
+# split the subscribers after campaign.planned_through into chunks,
+# committing (and yielding) each one as it is made
+def plan(campaign, chunk_size):
+    while True:
+        rest = db.session.query(Subscribe.id).filter(
+            Subscribe.id > campaign.planned_through).order_by(Subscribe.id)
+        last_id = rest.offset(chunk_size - 1).limit(1).scalar() or \
+            rest.order_by(None).with_entities(db.func.max(Subscribe.id)).scalar()
+        if last_id is None:
+            break
+        chunk = CampaignChunk(campaign=campaign, first_id=campaign.planned_through + 1,
+                              last_id=last_id)
+        campaign.planned_through = last_id
+        db.session.add(chunk)
+        db.session.commit()
+        yield chunk
+    campaign.planned = True
+    db.session.commit()
+    _check_finished(campaign)
+
+
+def _check_finished(campaign):
+    if campaign.planned and not campaign.chunks.filter_by(finished=False).count():
+        campaign.finished = datetime.utcnow()
+        db.session.commit()
+
+
+# at most NEWSLETTER_RATE messages a second over all workers
+def throttle():
+    rate = current_app.config['NEWSLETTER_RATE']
+    if not rate:
+        return
+    while True:
+        now = time.time()
+        key = RATE_KEY.format(int(now))
+        pipe = current_app.redis.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, 2)
+        if pipe.execute()[0] <= rate:
+            return
+        time.sleep(int(now) + 1 - now)
+
+
+def send_chunk(chunk):
+    campaign = chunk.campaign
+    after = chunk.sent_through or chunk.first_id - 1
+    subscribers = db.session.query(Subscribe.id, Subscribe.email).filter(
+        Subscribe.id > after, Subscribe.id <= chunk.last_id).order_by(Subscribe.id).all()
+
+    text_body = render_template('email/newsletter.txt', campaign=campaign)
+    html_body = render_template('email/newsletter.html', campaign=campaign)
+    sender = current_app.config['ADMINS'][0]
+    messages = [Message(campaign.subject, sender=sender, recipients=[email],
+                        body=text_body, html=html_body) for _, email in subscribers]
+
+    every = current_app.config['NEWSLETTER_CHECKPOINT']
+    checkpoint = {'done': 0}
+
+    def progress(done):
+        if done % every and done != len(messages):
+            return
+        chunk.sent_through = subscribers[done - 1].id
+        chunk.processed = (chunk.processed or 0) + done - checkpoint['done']
+        checkpoint['done'] = done
+        db.session.commit()
+
+    current_app.mail_queue.send_batch(messages, throttle=throttle, progress=progress)
+    chunk.finished = True
+    db.session.commit()
+    _check_finished(campaign)
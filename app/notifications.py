@@ -0,0 +1,105 @@
+import json
+import threading
+import time
+from flask import current_app
+from redis.exceptions import RedisError
+from app import db
+
+
+# notifications are pushed to open pages over server-sent events: every
+# committed User.add_notification is published on notifications:<user_id>
+# and /notifications/stream relays the channel. A client that reconnects
+# sends Last-Event-ID (the notification timestamp) and gets what it missed
+# from the database first.
+CHANNEL = 'notifications:{}'
+
+# streams open in this process; kept under NOTIFICATION_STREAMS_MAX so that
+# idle streams can never hold every gunicorn thread
+_open_streams = [0]
+_open_streams_lock = threading.Lock()
+
+
+def _pending(session):
+    return session.info.setdefault('notifications', [])
+
+
+# queue a notification to be published once the session commits
+def publish_on_commit(notification):
+    _pending(db.session()).append(notification)
+
+
+# publish right away, for events that are not stored (running task progress)
+def publish(user_id, name, data):
+    current_app.redis.publish(CHANNEL.format(user_id), json.dumps(
+        {'name': name, 'user_id': user_id, 'timestamp': time.time(), 'data': data}))
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _publish(session):
+    pending = session.info.pop('notifications', None)
+    if not pending:
+        return
+    try:
+        pipe = current_app.redis.pipeline(transaction=False)
+        for n in pending:
+            pipe.publish(CHANNEL.format(n['user_id']), json.dumps(n))
+        pipe.execute()
+    except RedisError:
+        # clients still catch up from the database on reconnect
+        current_app.logger.warning('notifications not published', exc_info=True)
+
+
+@db.event.listens_for(db.session, 'after_soft_rollback')
+def _discard(session, previous_transaction):
+    session.info.pop('notifications', None)
+
+
+def _event(n):
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(
+        n['timestamp'], n['name'], json.dumps(n['data']))
+
+
+# take a stream slot; False when the process already holds its maximum
+def acquire_stream():
+    with _open_streams_lock:
+        if _open_streams[0] >= current_app.config['NOTIFICATION_STREAMS_MAX']:
+            return False
+        _open_streams[0] += 1
+        return True
+
+
+def release_stream():
+    with _open_streams_lock:
+        _open_streams[0] -= 1
+
+
+# the SSE body for one connection, run with the request context: the
+# notifications newer than `since` that load_missed(since) returns, then
+# whatever is published until `timeout` seconds have passed, after which
+# the browser reconnects on its own. Subscribed before the database is
+# read, so nothing falls between the two; duplicates are skipped by
+# timestamp.
+def stream(user_id, since, load_missed, timeout=300, heartbeat=15):
+    pubsub = current_app.redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(CHANNEL.format(user_id))
+    try:
+        yield 'retry: 3000\n\n'
+        missed = load_missed(since)
+        # the connection goes back to the pool for the idle part
+        db.session.remove()
+        for n in missed:
+            since = max(since, n['timestamp'])
+            yield _event(n)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=heartbeat)
+            if message is None:
+                yield ': keepalive\n\n'
+                continue
+            n = json.loads(message['data'])
+            if n['timestamp'] <= since:
+                continue
+            since = n['timestamp']
+            yield _event(n)
+    finally:
+        pubsub.close()
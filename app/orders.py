@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+from flask import current_app, render_template
+from redis.exceptions import RedisError
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.email import send_email
+from app.exceptions import OutOfStock, ValidationError, IdempotencyKeyReused
+from app.models import MerchItem, Order
+
+
+# checkout for merch drops. The request does one conditional UPDATE of the
+# stock (never below zero, however many buyers race) and one INSERT of the
+# order in the same transaction, then hands the order to the RQ job
+# app.tasks.process_order. A retried request with the same Idempotency-Key
+# gets the order it already made instead of a second one; the same key
+# sent for another item or quantity raises IdempotencyKeyReused.
+def place_order(user, item, idempotency_key, quantity=1):
+    if not idempotency_key or len(idempotency_key) > 64:
+        raise ValidationError('an Idempotency-Key of up to 64 characters is required')
+    order = Order.query.filter_by(user_id=user.id, idempotency_key=idempotency_key).first()
+    if order is not None:
+        return _replay(order, item, quantity), False
+    if not MerchItem.reserve(item.id, quantity):
+        db.session.rollback()
+        raise OutOfStock('{} is sold out'.format(item.name))
+    order = Order(user_id=user.id, item_id=item.id, quantity=quantity,
+                  price=(item.price or 0) * quantity, idempotency_key=idempotency_key)
+    db.session.add(order)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # the same key won a race a moment ago; the rollback returns the unit
+        db.session.rollback()
+        order = Order.query.filter_by(user_id=user.id, idempotency_key=idempotency_key).one()
+        return _replay(order, item, quantity), False
+    queue(order)
+    return order, True
+
+
+# the stored order for a repeated key, if the request is the same one
+def _replay(order, item, quantity):
+    if order.item_id != item.id or order.quantity != quantity:
+        raise IdempotencyKeyReused('Idempotency-Key already used for order #{}'.format(order.id))
+    return order
+
+
+def queue(order):
+    try:
+        current_app.task_queue.enqueue('app.tasks.process_order', order.id)
+    except RedisError:
+        # stays reserved until `flask requeue-orders` picks it up
+        current_app.logger.warning('order %s not queued', order.id, exc_info=True)
+
+
+# confirm a reserved order; if that fails the unit goes back on sale
+def process(order):
+    try:
+        if not order.transition('reserved', 'confirmed'):
+            return False
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if order.transition('reserved', 'failed'):
+            MerchItem.release(order.item_id, order.quantity)
+        db.session.commit()
+        raise
+    send_email('[Flask_proj] Order #{} confirmed'.format(order.id),
+               sender=current_app.config['ADMINS'][0], recipients=[order.user.email],
+               text_body=render_template('email/order_confirmed.txt', order=order),
+               html_body=render_template('email/order_confirmed.html', order=order),
+               sync=True)
+    return True
+
+
+# queue again orders left reserved for longer than `minutes`
+def requeue_stale(minutes=10):
+    cutoff = datetime.utcnow() - timedelta(minutes=minutes)
+    orders = Order.query.filter(Order.status == 'reserved', Order.created < cutoff).all()
+    for order in orders:
+        queue(order)
+    return len(orders)
@@ -0,0 +1,50 @@
+import base64
+from datetime import datetime
+from app import db
+from app.exceptions import ValidationError
+
+
+# opaque cursor for a row, from its (created, id) sort key
+def encode_cursor(created, id):
+    raw = '{}|{}'.format(created.isoformat(), id)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created, id = raw.split('|')
+        return datetime.fromisoformat(created), int(id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValidationError('invalid cursor')
+
+
+# one page of a keyset (cursor) pagination, newest first
+class KeysetPage:
+    keyset = True
+
+    def __init__(self, items, next_cursor=None, total=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+# page through `query` by (created, id) descending, starting after `after`;
+# the COUNT(*) for the total is only run when asked for
+def keyset_paginate(query, model, after=None, per_page=10, with_total=False):
+    total = query.order_by(None).count() if with_total else None
+    if after:
+        created, id = decode_cursor(after)
+        query = query.filter(db.or_(
+            model.created < created,
+            db.and_(model.created == created, model.id < id)))
+    items = query.order_by(model.created.desc(), model.id.desc()).limit(per_page + 1).all()
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(items[-1].created, items[-1].id)
+    return KeysetPage(items, next_cursor=next_cursor, total=total)
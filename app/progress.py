@@ -0,0 +1,101 @@
+import json
+import time
+from flask import current_app
+from redis.exceptions import RedisError
+from rq import get_current_job
+from app import db, notifications
+
+
+# progress of a user's background tasks lives in one redis hash per user,
+#   tasks:progress:<user_id>  task id -> {"name", "description", "progress", "state"}
+# so "status of my tasks" is a single HGETALL. The database only sees a
+# task's start, completion and failure.
+KEY = 'tasks:progress:{}'
+TTL = 24 * 3600
+
+
+def _write(user_id, task_id, entry):
+    key = KEY.format(user_id)
+    pipe = current_app.redis.pipeline()
+    pipe.hset(key, task_id, json.dumps(entry))
+    pipe.expire(key, TTL)
+    pipe.execute()
+
+
+def register(task):
+    _write(task.user_id, task.id, {'name': task.name, 'description': task.description,
+                                   'progress': 0, 'state': 'queued'})
+
+
+# {task id: entry} for every recent task of the user
+def user_tasks(user_id):
+    entries = current_app.redis.hgetall(KEY.format(user_id))
+    return {task_id.decode('utf-8'): json.loads(entry) for task_id, entry in entries.items()}
+
+
+def task_progress(user_id, task_id):
+    entry = current_app.redis.hget(KEY.format(user_id), task_id)
+    return json.loads(entry)['progress'] if entry is not None else None
+
+
+# reports a running job's progress, coalesced: redis is written only when
+# progress moved by TASK_PROGRESS_STEP percent or TASK_PROGRESS_INTERVAL
+# seconds passed since the last write
+class ProgressReporter:
+    def __init__(self, task):
+        self.task = task
+        self.min_step = current_app.config['TASK_PROGRESS_STEP']
+        self.min_interval = current_app.config['TASK_PROGRESS_INTERVAL']
+        self.last_progress = None
+        self.last_time = 0
+        self.entry = {'name': task.name, 'description': task.description,
+                      'progress': 0, 'state': 'running'}
+
+    @staticmethod
+    def for_current_job():
+        from app.models import Task
+        job = get_current_job()
+        task = Task.query.get(job.get_id()) if job else None
+        return ProgressReporter(task) if task else None
+
+    def _publish(self, progress, state):
+        self.entry.update(progress=progress, state=state)
+        self.last_progress = progress
+        self.last_time = time.monotonic()
+        try:
+            _write(self.task.user_id, self.task.id, self.entry)
+            if state == 'running' and progress:
+                notifications.publish(self.task.user_id, 'task_progress',
+                                      {'task_id': self.task.id, 'progress': progress})
+        except RedisError:
+            current_app.logger.warning('task progress not saved', exc_info=True)
+
+    def _notify(self, progress, complete=False, failed=False):
+        data = {'task_id': self.task.id, 'progress': progress}
+        if failed:
+            data['failed'] = True
+        self.task.user.add_notification('task_progress', data)
+        if complete:
+            self.task.complete = True
+        db.session.commit()
+
+    def start(self):
+        self._publish(0, 'running')
+        self._notify(0)
+
+    def update(self, progress):
+        progress = min(int(progress), 99)
+        if self.last_progress is not None and \
+                progress - self.last_progress < self.min_step and \
+                time.monotonic() - self.last_time < self.min_interval:
+            return
+        self._publish(progress, 'running')
+
+    def finish(self):
+        self._publish(100, 'finished')
+        self._notify(100, complete=True)
+
+    def fail(self):
+        db.session.rollback()
+        self._publish(100, 'failed')
+        self._notify(100, complete=True, failed=True)
@@ -1,12 +1,18 @@
-from flask import render_template, request, flash
+from uuid import uuid4
+from flask import render_template, request, flash, make_response, redirect, url_for
 from flask_login import current_user, login_required
-from app.models import db, MerchItem, Permission
+from app.models import db, MerchItem, Permission, Order
+from app.cache import cached, invalidate, make_etag, not_modified, add_validators
+from app.pagination import keyset_paginate
+from app import images, uploads, orders
+from app.exceptions import OutOfStock, IdempotencyKeyReused
 from . import sale
 from flask import jsonify
 
 
 # page with a list of merch items for sale
 @sale.route('/shop', methods=['GET', 'POST'])
+@cached('shop')
 def show_items_sale():
     page = request.args.get('page')
 
@@ -14,10 +20,37 @@ def show_items_sale():
         page = int(page)
     else:
         page = 1
-        items = MerchItem.query.order_by(MerchItem.created.desc())
-        pages = items.paginate(page=page, per_page=5)
 
-    return render_template('sales/sales.html', items=items, pages=pages)
+    per_page = 5
+    keyset = 'page' not in request.args
+    next_page = None
+    if keyset:
+        # cursor pagination: /sale/shop, then ?after=<cursor>; ?page=N still works;
+        # the page decides the next link, so it is fetched before the ETag check
+        pages = keyset_paginate(MerchItem.query, MerchItem,
+                                after=request.args.get('after'), per_page=per_page)
+        next_page = (pages.next_cursor, pages.has_next)
+
+    # the listing changes when items are added, removed or edited; the
+    # pagination mode is part of it, the same url renders either
+    newest, last_id, count, last_update = db.session.query(
+        db.func.max(MerchItem.created), db.func.max(MerchItem.id), db.func.count(MerchItem.id),
+        db.func.max(MerchItem.updated)).one()
+    etag = make_etag(newest, last_id, count, last_update, keyset, next_page, per_page,
+                     sorted(request.args.items()), current_user.get_id())
+    response = not_modified(etag)
+    if response:
+        return response
+
+    items = MerchItem.query.order_by(MerchItem.created.desc())
+    if not keyset:
+        pages = items.paginate(page=page, per_page=per_page)
+
+    srcsets = images.srcsets([item.image for item in pages.items])
+    srcsets[None] = images.static_srcsets('t-shirts.jpg')
+    response = make_response(render_template('sales/sales.html', items=items, pages=pages,
+                                             srcsets=srcsets))
+    return add_validators(response, etag)
 
 
 # add a product for sale to the database
@@ -29,10 +62,16 @@ def add_item_merch():
             name = request.form['name']
             description = request.form['description']
             price = request.form['price']
-            item = MerchItem(name=name, description=description, price=price)
+            stock = request.form.get('stock', 0, type=int)
+            item = MerchItem(name=name, description=description, price=price, stock=max(stock, 0))
+            picture = request.files.get('image')
+            if picture and picture.filename and images.is_image(picture.filename):
+                item.image = uploads.store_stream(picture.stream)
+                images.queue_variants(item.image)
             try:
                 db.session.add(item)
                 db.session.commit()
+                invalidate('shop')
                 flash('You were successfully add item !', category='success')
 
             except Exception:
@@ -59,18 +98,40 @@ def show_item():
     return render_template('block.html')
 
 
-@sale.route('/item/<item_id>', methods=['GET'])
+@sale.route('/item/<int:item_id>', methods=['GET'])
 @login_required
 def item_detail(item_id):
-    item = MerchItem.query.filter_by(id=item_id).first()
-    return render_template('sales/item_detail.html', item=item)
+    item = MerchItem.query.filter_by(id=item_id).first_or_404()
+    return render_template('sales/item_detail.html', item=item, idempotency_key=uuid4().hex)
 
 
-@sale.route('<id>/buy', methods=['GET'])
+# checkout; the Idempotency-Key header (or the form field the detail page
+# renders) makes a retried purchase return the first order
+@sale.route('/<int:item_id>/buy', methods=['POST'])
 @login_required
 def buy_merch_item(item_id):
-    item = MerchItem.query.filter_by(id=item_id).first()
-    if item:
-        return jsonify({'message': f'Item bought name {item.name}'})
-    else:
-        return jsonify({'message': 'Item not found'}), 404
+    item = MerchItem.query.get_or_404(item_id)
+    key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+    wants_json = request.accept_mimetypes.accept_json and \
+        not request.accept_mimetypes.accept_html
+    try:
+        order, created = orders.place_order(current_user, item, key)
+    except (OutOfStock, IdempotencyKeyReused) as e:
+        if wants_json:
+            return jsonify({'message': e.args[0]}), 409 if isinstance(e, OutOfStock) else 422
+        flash(e.args[0], category='error')
+        return redirect(url_for('sales.item_detail', item_id=item.id))
+    if wants_json:
+        response = jsonify(order.to_dict())
+        response.status_code = 202 if created else 200
+        response.headers['Location'] = order.to_dict()['url']
+        return response
+    flash('Order #{} received'.format(order.id), category='success')
+    return redirect(url_for('sales.item_detail', item_id=item.id))
+
+
+@sale.route('/orders/<int:order_id>', methods=['GET'])
+@login_required
+def order_status(order_id):
+    order = Order.query.filter_by(id=order_id, user_id=current_user.id).first_or_404()
+    return jsonify(order.to_dict())
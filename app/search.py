@@ -0,0 +1,172 @@
+from flask import current_app
+from markupsafe import Markup, escape
+from sqlalchemy import text
+from app import db
+
+
+# highlight markers put into snippets by the database, replaced after escaping
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+
+# full-text search over posts, one backend per database dialect
+class SearchBackend:
+    name = None
+
+    def add_to_index(self, post):
+        raise NotImplementedError
+
+    def remove_from_index(self, post):
+        raise NotImplementedError
+
+    # returns (ids ordered by rank, total, {id: snippet})
+    def query_index(self, q, page, per_page):
+        raise NotImplementedError
+
+
+# sqlite FTS5 virtual table with rowid = posts.id (dev and tests)
+class SqliteSearch(SearchBackend):
+    name = 'sqlite'
+
+    def __init__(self):
+        self._ready = set()
+
+    def _ensure_table(self):
+        engine = db.get_engine()
+        if engine not in self._ready:
+            db.session.execute(text(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(title, body)'))
+            self._ready.add(engine)
+
+    @staticmethod
+    def _match_expr(q):
+        # every word is a quoted phrase, so user input is never FTS syntax
+        return ' '.join('"{}"'.format(word.replace('"', '""')) for word in q.split())
+
+    def add_to_index(self, post):
+        self._ensure_table()
+        db.session.execute(text('DELETE FROM posts_fts WHERE rowid = :id'), {'id': post.id})
+        db.session.execute(text(
+            'INSERT INTO posts_fts (rowid, title, body) VALUES (:id, :title, :body)'),
+            {'id': post.id, 'title': post.title or '', 'body': post.body or ''})
+
+    def remove_from_index(self, post):
+        self._ensure_table()
+        db.session.execute(text('DELETE FROM posts_fts WHERE rowid = :id'), {'id': post.id})
+
+    def query_index(self, q, page, per_page):
+        self._ensure_table()
+        match = self._match_expr(q)
+        if not match:
+            return [], 0, {}
+        total = db.session.execute(text(
+            'SELECT COUNT(*) FROM posts_fts WHERE posts_fts MATCH :q'), {'q': match}).scalar()
+        rows = db.session.execute(text(
+            'SELECT rowid, snippet(posts_fts, 1, :start, :end, \'...\', 16) '
+            'FROM posts_fts WHERE posts_fts MATCH :q '
+            'ORDER BY bm25(posts_fts, 10.0, 1.0) LIMIT :limit OFFSET :offset'),
+            {'q': match, 'start': MARK_START, 'end': MARK_END,
+             'limit': per_page, 'offset': (page - 1) * per_page})
+        ids, snippets = [], {}
+        for post_id, snippet in rows:
+            ids.append(post_id)
+            snippets[post_id] = snippet
+        return ids, total, snippets
+
+
+# postgres tsvector column on posts with a GIN index (production)
+class PostgresSearch(SearchBackend):
+    name = 'postgres'
+
+    def __init__(self, language='english'):
+        self.language = language
+
+    def add_to_index(self, post):
+        db.session.execute(text(
+            'UPDATE posts SET search_vector = '
+            "setweight(to_tsvector(CAST(:lang AS regconfig), coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector(CAST(:lang AS regconfig), coalesce(body, '')), 'B') "
+            'WHERE id = :id'), {'lang': self.language, 'id': post.id})
+
+    def remove_from_index(self, post):
+        # the vector lives on the posts row and goes away with it
+        pass
+
+    def query_index(self, q, page, per_page):
+        params = {'lang': self.language, 'q': q}
+        total = db.session.execute(text(
+            'SELECT COUNT(*) FROM posts '
+            'WHERE search_vector @@ plainto_tsquery(CAST(:lang AS regconfig), :q)'),
+            params).scalar()
+        rows = db.session.execute(text(
+            'SELECT id, ts_headline(CAST(:lang AS regconfig), coalesce(body, \'\'), query, :opts) '
+            'FROM (SELECT id, body, query, ts_rank_cd(search_vector, query) AS rank '
+            '      FROM posts, plainto_tsquery(CAST(:lang AS regconfig), :q) AS query '
+            '      WHERE search_vector @@ query '
+            '      ORDER BY rank DESC, id DESC LIMIT :limit OFFSET :offset) AS hits '
+            'ORDER BY rank DESC, id DESC'),
+            dict(params, limit=per_page, offset=(page - 1) * per_page,
+                 opts='StartSel={}, StopSel={}, MaxWords=35, MinWords=15'.format(
+                     MARK_START, MARK_END)))
+        ids, snippets = [], {}
+        for post_id, snippet in rows:
+            ids.append(post_id)
+            snippets[post_id] = snippet
+        return ids, total, snippets
+
+
+# substring scan, for databases without a full-text engine
+class LikeSearch(SearchBackend):
+    name = 'like'
+
+    def add_to_index(self, post):
+        pass
+
+    def remove_from_index(self, post):
+        pass
+
+    def query_index(self, q, page, per_page):
+        from app.models import Post
+        query = Post.query.filter(Post.title.contains(q) | Post.body.contains(q))
+        pagination = query.order_by(Post.created.desc()).paginate(
+            page=page, per_page=per_page, error_out=False)
+        return [post.id for post in pagination.items], pagination.total, {}
+
+
+backends = {
+    'sqlite': SqliteSearch,
+    'postgres': PostgresSearch,
+    'like': LikeSearch,
+}
+
+
+def create_search_backend(app):
+    name = app.config.get('SEARCH_BACKEND')
+    if not name:
+        uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+        if uri.startswith('sqlite'):
+            name = 'sqlite'
+        elif uri.startswith('postgres'):
+            name = 'postgres'
+        else:
+            name = 'like'
+    return backends[name]()
+
+
+def add_to_index(post):
+    current_app.search.add_to_index(post)
+
+
+def remove_from_index(post):
+    current_app.search.remove_from_index(post)
+
+
+def query_index(q, page, per_page):
+    return current_app.search.query_index(q, page, per_page)
+
+
+# escape a snippet and turn the highlight markers into <mark> tags
+def highlight(snippet):
+    if not snippet:
+        return ''
+    return Markup(str(escape(snippet)).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
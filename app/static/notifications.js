@@ -0,0 +1,58 @@
+// progress of the user's background tasks (exports), pushed over
+// /notifications/stream; the page keeps one EventSource open and the
+// browser reconnects it with Last-Event-ID when the server closes it
+(function () {
+  var el = document.getElementById('task-progress');
+  if (!el || !window.EventSource) {
+    return;
+  }
+  var tasks = {};
+
+  function render() {
+    el.textContent = Object.keys(tasks).map(function (id) {
+      var task = tasks[id];
+      return (task.description || 'Task') + ' ' +
+        (task.failed ? 'failed' : task.progress + '%');
+    }).join(' · ');
+  }
+
+  // names of tasks this page has not seen yet, one redis read
+  function loadStatus() {
+    fetch(el.dataset.status, {credentials: 'same-origin'})
+      .then(function (response) { return response.json(); })
+      .then(function (body) {
+        Object.keys(body.tasks).forEach(function (id) {
+          if (tasks[id]) {
+            tasks[id].description = body.tasks[id].description;
+          }
+        });
+        render();
+      });
+  }
+
+  function connect() {
+    var source = new EventSource(el.dataset.stream);
+    source.addEventListener('task_progress', function (event) {
+      var data = JSON.parse(event.data);
+      var known = tasks[data.task_id];
+      tasks[data.task_id] = {
+        description: known && known.description,
+        progress: data.progress,
+        failed: data.failed
+      };
+      if (!known) {
+        loadStatus();
+      }
+      render();
+    });
+    // refused (too many streams open) or the server is gone: the browser
+    // gives up on such errors, so try again later
+    source.onerror = function () {
+      if (source.readyState === EventSource.CLOSED) {
+        setTimeout(connect, 30000);
+      }
+    };
+  }
+
+  connect();
+})();
@@ -1,52 +1,117 @@
-import json
 import sys
-import time
-from flask import render_template
+from flask import render_template, url_for
 from rq import get_current_job
-from app import create_app, db
-from app.models import User, Post, Task
+from app import create_app, db, likes, newsletter, ingest, images, orders
+from app.models import User, Post, Campaign, CampaignChunk, Order
 from app.email import send_email
+from app.exports import export_path, write_export
+from app.progress import ProgressReporter
 
 
 app = create_app('development')
 app.app_context().push()
 
 
-def _set_task_progress(progress):
-    job = get_current_job()
-    if job:
-        job.meta['progress'] = progress
-        job.save_meta()
-        task = Task.query.get(job.get_id())
-        task.user.add_notification('task_progress', {'task_id': job.get_id(),
-                                                     'progress': progress})
-        if progress >= 100:
-            task.complete = True
-        db.session.commit()
-
-
-def export_posts(user_id):
+def export_posts(user_id, fmt='ndjson'):
+    reporter = ProgressReporter.for_current_job()
     try:
         user = User.query.get(user_id)
-        _set_task_progress(0)
-        data = []
-        i = 0
-        total_posts = user.posts.count()
-        for post in user.posts.order_by(Post.timestamp.asc()):
-            data.append({'body': post.body,
-                         'timestamp': post.timestamp.isoformat() + 'Z'})
-            time.sleep(5)
-            i += 1
-            _set_task_progress(100 * i // total_posts)
+        if reporter:
+            reporter.start()
+        job = get_current_job()
+        task_id = job.get_id() if job else 'manual-{}'.format(user_id)
+        path = export_path(task_id, fmt)
+
+        # the last percent is left for the email
+        def progress(done, total):
+            reporter.update(99 * done // total)
+        write_export(user_id, path, fmt, chunk_size=app.config['EXPORT_CHUNK_SIZE'],
+                     progress=progress if reporter else None)
 
+        # the file is offered as a download link, not attached
+        with app.test_request_context(base_url=app.config['BASE_URL']):
+            url = url_for('main.download_export', task_id=task_id, _external=True)
         send_email('[Flask_proj] Your blog posts',
                    sender=app.config['ADMINS'][0], recipients=[user.email],
-                   text_body=render_template('email/export_posts.txt', user=user),
-                   html_body=render_template('email/export_posts.html', user=user),
-                   attachments=[('posts.json', 'application/json',
-                                 json.dumps({'posts': data}, indent=4))],
+                   text_body=render_template('email/export_posts.txt', user=user, url=url),
+                   html_body=render_template('email/export_posts.html', user=user, url=url),
                    sync=True)
+        if reporter:
+            reporter.finish()
+
+    except Exception:
+        app.logger.error('Unhandled exception', exc_info=sys.exc_info())
+        if reporter:
+            reporter.fail()
+
+
+# applies likes buffered in redis (LIKE_WRITE_BEHIND), see app/likes.py
+def flush_likes():
+    try:
+        likes.flush(batch_size=app.config['LIKE_FLUSH_BATCH'])
+    except Exception:
+        db.session.rollback()
+        app.logger.error('Unhandled exception', exc_info=sys.exc_info())
+        raise
+
+
+# writes /contact and /subscribe posts buffered in redis, see app/ingest.py
+def flush_forms():
+    try:
+        ingest.flush(batch_size=app.config['FORM_FLUSH_BATCH'])
+    except Exception:
+        db.session.rollback()
+        app.logger.error('Unhandled exception', exc_info=sys.exc_info())
+        raise
+
 
+# resized JPEG/WebP copies of an uploaded image, see app/images.py
+def make_image_variants(sha256):
+    try:
+        images.make_variants(sha256)
+    except Exception:
+        db.session.rollback()
+        app.logger.error('Unhandled exception', exc_info=sys.exc_info())
+        raise
+
+
+# splits a newsletter campaign into chunk jobs, see app/newsletter.py
+def plan_campaign(campaign_id):
+    try:
+        campaign = Campaign.query.get(campaign_id)
+        for chunk in newsletter.plan(campaign, app.config['NEWSLETTER_CHUNK_SIZE']):
+            app.task_queue.enqueue('app.tasks.send_campaign_chunk', chunk.id)
+    except Exception:
+        db.session.rollback()
+        app.logger.error('Unhandled exception', exc_info=sys.exc_info())
+        raise
+
+
+def send_campaign_chunk(chunk_id):
+    # a resumed campaign may queue a chunk that is still being sent
+    lock = app.redis.lock('newsletter:chunk:{}'.format(chunk_id), timeout=3600,
+                          blocking_timeout=0)
+    if not lock.acquire():
+        return
+    try:
+        chunk = CampaignChunk.query.get(chunk_id)
+        if chunk is not None and not chunk.finished:
+            newsletter.send_chunk(chunk)
+    except Exception:
+        db.session.rollback()
+        app.logger.error('Unhandled exception', exc_info=sys.exc_info())
+        raise
+    finally:
+        lock.release()
+
+
+# confirms a merch order reserved at checkout, see app/orders.py
+def process_order(order_id):
+    try:
+        order = Order.query.get(order_id)
+        if order is not None:
+            orders.process(order)
     except Exception:
-        _set_task_progress(100)
+        db.session.rollback()
         app.logger.error('Unhandled exception', exc_info=sys.exc_info())
+        raise
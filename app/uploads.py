@@ -0,0 +1,123 @@
+import hashlib
+import os
+import tempfile
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.auth_cache import LocalCache
+
+
+# content-addressed file store under UPLOAD_FOLDER:
+#   sha256/ab/abcdef...   one file per distinct content
+#   partial/<upload id>   chunked uploads still being received
+# A chunk is appended to its partial file straight from the request stream
+# and hashed as it goes by; the running hash stays in the worker that got
+# the previous chunk, and finalize re-reads the file only when the chunks
+# were spread over several workers.
+BLOCK_SIZE = 64 * 1024
+
+_hashers = LocalCache(maxsize=256)
+
+
+def _root():
+    return current_app.config['UPLOAD_FOLDER']
+
+
+def blob_path(sha256):
+    return os.path.join(_root(), 'sha256', sha256[:2], sha256)
+
+
+def partial_path(upload_id):
+    return os.path.join(_root(), 'partial', upload_id)
+
+
+def _copy(stream, f, hasher, limit=None):
+    written = 0
+    while True:
+        block = stream.read(BLOCK_SIZE if limit is None else min(BLOCK_SIZE, limit - written))
+        if not block:
+            return written
+        f.write(block)
+        hasher.update(block)
+        written += len(block)
+        if limit is not None and written >= limit:
+            return written
+
+
+# move a finished file into the store; an identical blob already there wins
+def _commit(path, sha256):
+    target = blob_path(sha256)
+    if os.path.exists(target):
+        os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+    return sha256
+
+
+# store a whole stream (a form upload); returns its sha256
+def store_stream(stream):
+    os.makedirs(os.path.join(_root(), 'partial'), exist_ok=True)
+    hasher = hashlib.sha256()
+    fd, path = tempfile.mkstemp(dir=os.path.join(_root(), 'partial'))
+    with os.fdopen(fd, 'wb') as f:
+        _copy(stream, f, hasher)
+    return _commit(path, hasher.hexdigest())
+
+
+# append `length` bytes of `stream` to an upload that has `offset` bytes so
+# far; bytes past `offset` from a dropped earlier attempt are overwritten.
+# Returns the number of bytes written.
+def write_chunk(upload_id, offset, stream, length):
+    path = partial_path(upload_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # taken out while in use, a concurrent retry of the chunk starts over
+    cached = _hashers.get(upload_id)
+    _hashers.pop(upload_id)
+    hasher = cached[1] if cached is not None and cached[0] == offset else None
+    if hasher is None and offset == 0:
+        hasher = hashlib.sha256()
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.truncate(offset)
+        f.seek(offset)
+        written = _copy(stream, f, hasher or hashlib.sha256(), limit=length)
+    if hasher is not None and written == length:
+        _hashers.set(upload_id, (offset + written, hasher),
+                     current_app.config['UPLOAD_EXPIRATION'])
+    return written
+
+
+# hash and store a completely received upload; returns its sha256
+def finalize(upload_id, size):
+    path = partial_path(upload_id)
+    cached = _hashers.get(upload_id)
+    _hashers.pop(upload_id)
+    if cached is not None and cached[0] == size:
+        hasher = cached[1]
+    else:
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                hasher.update(block)
+    return _commit(path, hasher.hexdigest())
+
+
+def discard(upload_id):
+    _hashers.pop(upload_id)
+    try:
+        os.remove(partial_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+
+# drop uploads left unfinished for longer than UPLOAD_EXPIRATION, rows and
+# partial files; returns how many
+def expire():
+    from app.models import Upload
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['UPLOAD_EXPIRATION'])
+    stale = Upload.query.filter(Upload.completed.is_(None), Upload.created < cutoff).all()
+    for upload in stale:
+        discard(upload.id)
+        db.session.delete(upload)
+    db.session.commit()
+    return len(stale)
@@ -11,19 +11,74 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     ELASTICSEARCH_URL = os.getenv('ELASTICSEARCH_URL')
+    SEARCH_BACKEND = os.getenv('SEARCH_BACKEND')
     FLASK_ADMIN = os.getenv('FLASK_ADMIN')
     WTF_CSRF_ENABLED = False
     SECURITY_PASSWORD_SALT = os.getenv('SALT')
     SECURITY_PASSWORD_HASH = 'bcrypt'
+    PASSWORD_HASH_SCHEME = os.getenv('PASSWORD_HASH_SCHEME') or SECURITY_PASSWORD_HASH
+    PASSWORD_HASH_ROUNDS = int(os.getenv('PASSWORD_HASH_ROUNDS') or 12)
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS') or 2)
+    PASSWORD_HASH_QUEUE_SIZE = 4
+    PASSWORD_HASH_QUEUE_TIMEOUT = 2
+    PASSWORD_HASH_TIMEOUT = 10
     FLASKY_COMMENTS_PER_PAGE = 5
     MAIL_SERVER = os.getenv('MAIL_SERVER')
     MAIL_PORT = int(os.getenv('MAIL_PORT'))
     MAIL_USE_TLS = 1
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
+    MAIL_WORKERS = 2
+    MAIL_BATCH_SIZE = 50
+    MAIL_QUEUE_SIZE = 1000
+    MAIL_QUEUE_TIMEOUT = 5
+    MAIL_RETRIES = 3
+    MAIL_RETRY_BACKOFF = 1
+    NEWSLETTER_CHUNK_SIZE = 1000
+    NEWSLETTER_CHECKPOINT = 100
+    NEWSLETTER_RATE = 50
     ALLOWED_EXTENSIONS = os.getenv('ALLOWED_EXTENSIONS')
-    UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER')
+    UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER') or os.path.join(basedir, 'uploads')
+    UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+    UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+    UPLOAD_EXPIRATION = 24 * 3600
+    UPLOAD_CLAIM_TIMEOUT = 300
+    IMAGE_WIDTHS = [320, 640, 1024, 1600]
+    # form posts, and the legacy single-request upload, are refused above this
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+    EXPORT_FOLDER = os.getenv('EXPORT_FOLDER') or os.path.join(basedir, 'exports')
+    EXPORT_CHUNK_SIZE = 500
+    TASK_PROGRESS_STEP = 5
+    TASK_PROGRESS_INTERVAL = 2
+    NOTIFICATION_STREAM_TIMEOUT = 300
+    NOTIFICATION_HEARTBEAT = 15
+    # per process, below the gunicorn --threads of Procfile and start.sh
+    NOTIFICATION_STREAMS_MAX = int(os.getenv('NOTIFICATION_STREAMS_MAX', '16'))
+    BASE_URL = os.getenv('BASE_URL') or 'http://localhost:5000'
+    ADMINS = [os.getenv('MAIL_USERNAME')]
     REDIS_URL = os.getenv('REDIS_URL') or 'redis://'
+    CALENDAR_LOCALES = ['C.UTF-8', 'uk_UA.UTF-8', 'en_US.UTF-8']
+    CALENDAR_MAX_RANGE = 366
+    COMPRESS = True
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    COMPRESS_BR_QUALITY = 4
+    RESPONSE_CACHE = True
+    RESPONSE_CACHE_TIMEOUT = 300
+    TOKEN_CACHE = True
+    TOKEN_CACHE_TTL = 300
+    TOKEN_CACHE_SIZE = 1024
+    PRINCIPAL_CACHE = True
+    PRINCIPAL_CACHE_TTL = 60
+    PRINCIPAL_CACHE_SIZE = 4096
+    LIKE_WRITE_BEHIND = os.getenv('LIKE_WRITE_BEHIND') == '1'
+    LIKE_FLUSH_INTERVAL = 1
+    LIKE_FLUSH_BATCH = 1000
+    FORM_WRITE_BEHIND = os.getenv('FORM_WRITE_BEHIND', '1') == '1'
+    FORM_FLUSH_INTERVAL = 2
+    FORM_FLUSH_BATCH = 1000
+    FORM_STREAM_MAXLEN = 100000
+    FORM_SEEN_TTL = 24 * 3600
 
     @staticmethod
     def init_app(app):
@@ -42,6 +97,16 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URL') or \
         'sqlite://'
     WTF_CSRF_ENABLED = False
+    RESPONSE_CACHE = False
+    TOKEN_CACHE = False
+    PRINCIPAL_CACHE = False
+    PASSWORD_HASH_SCHEME = 'pbkdf2_sha256'
+    PASSWORD_HASH_ROUNDS = 1000
+    PASSWORD_HASH_WORKERS = 0
+    MAIL_WORKERS = 0
+    NEWSLETTER_RATE = 0
+    FORM_WRITE_BEHIND = False
+    ALLOWED_EXTENSIONS = 'jpg png'
 
 
 class ProductionConfig(Config):
@@ -1,10 +1,12 @@
 #!/usr/bin/env python
 
 import os
+import click
 from flask_migrate import Migrate, upgrade
 from app import create_app, db
 from dotenv import load_dotenv
-from app.models import Task, User, Role, Permission, Post, Comment, Like, Notification
+from app import newsletter, images, assets, orders, uploads
+from app.models import Task, User, Role, Permission, Post, Comment, Like, Notification, Campaign
 
 
 dotenv_path = os.path.join(os.path.dirname(__file__), '.env')
@@ -30,3 +32,67 @@ def deploy_app():
 
     # create or update user roles
     Role.insert_roles()
+
+    # resized copies of the images shipped in app/static
+    for filename in ('backg.jpg', 't-shirts.jpg'):
+        images.make_static_variants(filename)
+
+    # hashed, precompressed copies of app/static
+    assets.build(app.static_folder)
+
+
+@app.cli.command("reconcile-counters")
+@click.option('--batch-size', default=500, help='Posts checked per transaction.')
+def reconcile_counters(batch_size):
+    """Recount drifted like/comment counters on posts."""
+    fixed = Post.reconcile_counters(batch_size=batch_size)
+    click.echo('{} posts fixed'.format(fixed))
+
+
+@app.cli.command("send-newsletter")
+@click.argument('subject')
+@click.argument('body', type=click.File('r'))
+def send_newsletter(subject, body):
+    """Mail a newsletter to every subscriber."""
+    campaign = newsletter.launch(subject, body.read())
+    click.echo('campaign {} queued'.format(campaign.id))
+
+
+@app.cli.command("resume-newsletter")
+@click.argument('campaign_id', type=int)
+def resume_newsletter(campaign_id):
+    """Queue the unsent part of an interrupted campaign."""
+    campaign = Campaign.query.get(campaign_id)
+    if campaign is None:
+        raise click.BadParameter('no such campaign')
+    newsletter.resume(campaign)
+    click.echo('{} subscribers done so far'.format(campaign.processed_count()))
+
+
+@app.cli.command("static-image-variants")
+@click.argument('filenames', nargs=-1)
+def static_image_variants(filenames):
+    """Write resized JPEG/WebP copies of images in app/static."""
+    for filename in filenames or ('backg.jpg', 't-shirts.jpg'):
+        made = images.make_static_variants(filename)
+        click.echo('{}: {} variants'.format(filename, len(made)))
+
+
+@app.cli.command("assets")
+def build_assets():
+    """Write fingerprinted, precompressed copies of app/static."""
+    manifest = assets.build(app.static_folder)
+    click.echo('{} files in {}'.format(len(manifest), assets.DIST))
+
+
+@app.cli.command("requeue-orders")
+@click.option('--minutes', default=10, help='Age of a reserved order to queue again.')
+def requeue_orders(minutes):
+    """Queue again merch orders stuck in the reserved state."""
+    click.echo('{} orders queued'.format(orders.requeue_stale(minutes)))
+
+
+@app.cli.command("expire-uploads")
+def expire_uploads():
+    """Delete chunked uploads left unfinished past UPLOAD_EXPIRATION."""
+    click.echo('{} uploads expired'.format(uploads.expire()))
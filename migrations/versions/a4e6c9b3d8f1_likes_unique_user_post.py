@@ -0,0 +1,35 @@
+"""unique (user_id, post_id) on likes
+
+Revision ID: a4e6c9b3d8f1
+Revises: f2b7d4e8c1a5
+Create Date: 2026-10-18 14:40:52.118734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4e6c9b3d8f1'
+down_revision = 'f2b7d4e8c1a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # drop duplicate likes left by concurrent clicks, keep the oldest
+    op.execute('DELETE FROM likes WHERE id NOT IN '
+               '(SELECT min_id FROM (SELECT MIN(id) AS min_id FROM likes '
+               'GROUP BY user_id, post_id) AS keep)')
+    op.execute('UPDATE posts SET like_count = '
+               '(SELECT COUNT(*) FROM likes WHERE likes.post_id = posts.id)')
+
+    with op.batch_alter_table('likes', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_likes_user_post', ['user_id', 'post_id'])
+        batch_op.create_index(batch_op.f('ix_likes_post_id'), ['post_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('likes', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_likes_post_id'))
+        batch_op.drop_constraint('uq_likes_user_post', type_='unique')
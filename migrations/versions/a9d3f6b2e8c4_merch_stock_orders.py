@@ -0,0 +1,49 @@
+"""merch stock and orders
+
+Revision ID: a9d3f6b2e8c4
+Revises: f4c8e2a6d9b3
+Create Date: 2026-10-18 20:12:47.301955
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d3f6b2e8c4'
+down_revision = 'f4c8e2a6d9b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('merch_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('stock', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_check_constraint('ck_merch_item_stock', 'stock >= 0')
+
+    op.create_table('orders',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('price', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=16), nullable=False),
+    sa.Column('idempotency_key', sa.String(length=64), nullable=False),
+    sa.Column('created', sa.DateTime(), nullable=True),
+    sa.Column('processed', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['item_id'], ['merch_item.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'idempotency_key', name='uq_orders_user_idempotency_key')
+    )
+    op.create_index('ix_orders_status_created', 'orders', ['status', 'created'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_orders_status_created', table_name='orders')
+    op.drop_table('orders')
+    with op.batch_alter_table('merch_item', schema=None) as batch_op:
+        # sqlite does not reflect check constraints; recreating the table drops it
+        if op.get_bind().dialect.name != 'sqlite':
+            batch_op.drop_constraint('ck_merch_item_stock', type_='check')
+        batch_op.drop_column('stock')
@@ -0,0 +1,34 @@
+"""like and comment counters on posts
+
+Revision ID: b1c4e2f7a9d3
+Revises: 73da342c409d
+Create Date: 2026-10-18 10:12:41.318220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c4e2f7a9d3'
+down_revision = '73da342c409d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+
+    # backfill counters for existing posts
+    op.execute('UPDATE posts SET like_count = '
+               '(SELECT COUNT(*) FROM likes WHERE likes.post_id = posts.id)')
+    op.execute('UPDATE posts SET comment_count = '
+               '(SELECT COUNT(*) FROM comments WHERE comments.post_id = posts.id)')
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('comment_count')
+        batch_op.drop_column('like_count')
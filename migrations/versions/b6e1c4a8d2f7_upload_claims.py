@@ -0,0 +1,26 @@
+"""upload chunk claims
+
+Revision ID: b6e1c4a8d2f7
+Revises: a9d3f6b2e8c4
+Create Date: 2026-10-18 21:04:12.518337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e1c4a8d2f7'
+down_revision = 'a9d3f6b2e8c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('uploads', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('claimed', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('uploads', schema=None) as batch_op:
+        batch_op.drop_column('claimed')
@@ -0,0 +1,26 @@
+"""(user_id, timestamp) index on notifications
+
+Revision ID: b8d1f5a2c6e9
+Revises: a4e6c9b3d8f1
+Create Date: 2026-10-18 16:05:37.402915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8d1f5a2c6e9'
+down_revision = 'a4e6c9b3d8f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.create_index('ix_notifications_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('ix_notifications_user_id_timestamp')
@@ -0,0 +1,48 @@
+"""newsletter campaigns and their chunks
+
+Revision ID: c3e7a1d9f4b2
+Revises: b8d1f5a2c6e9
+Create Date: 2026-10-18 16:48:12.905113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e7a1d9f4b2'
+down_revision = 'b8d1f5a2c6e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('campaigns',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('subject', sa.String(length=128), nullable=True),
+    sa.Column('body', sa.Text(), nullable=True),
+    sa.Column('created', sa.DateTime(), nullable=True),
+    sa.Column('planned_through', sa.Integer(), nullable=True),
+    sa.Column('planned', sa.Boolean(), nullable=True),
+    sa.Column('finished', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('campaign_chunks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('campaign_id', sa.Integer(), nullable=True),
+    sa.Column('first_id', sa.Integer(), nullable=True),
+    sa.Column('last_id', sa.Integer(), nullable=True),
+    sa.Column('sent_through', sa.Integer(), nullable=True),
+    sa.Column('processed', sa.Integer(), nullable=True),
+    sa.Column('finished', sa.Boolean(), nullable=True),
+    sa.ForeignKeyConstraint(['campaign_id'], ['campaigns.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_campaign_chunks_campaign_id_finished', 'campaign_chunks',
+                    ['campaign_id', 'finished'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_campaign_chunks_campaign_id_finished', table_name='campaign_chunks')
+    op.drop_table('campaign_chunks')
+    op.drop_table('campaigns')
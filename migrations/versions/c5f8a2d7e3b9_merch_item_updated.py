@@ -0,0 +1,28 @@
+"""merch item updated timestamp
+
+Revision ID: c5f8a2d7e3b9
+Revises: b6e1c4a8d2f7
+Create Date: 2026-10-18 21:26:39.904112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f8a2d7e3b9'
+down_revision = 'b6e1c4a8d2f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('merch_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    # sqlite rebuilds the table and does not reflect the check constraint
+    with op.batch_alter_table('merch_item', schema=None, table_args=(
+            sa.CheckConstraint('stock >= 0', name='ck_merch_item_stock'),)) as batch_op:
+        batch_op.drop_column('updated')
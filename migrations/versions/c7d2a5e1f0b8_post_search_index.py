@@ -0,0 +1,41 @@
+"""full-text search index for posts
+
+Revision ID: c7d2a5e1f0b8
+Revises: b1c4e2f7a9d3
+Create Date: 2026-10-18 11:03:27.551904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2a5e1f0b8'
+down_revision = 'b1c4e2f7a9d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.add_column('posts', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+        op.execute("UPDATE posts SET search_vector = "
+                   "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+                   "setweight(to_tsvector('english', coalesce(body, '')), 'B')")
+        op.create_index('ix_posts_search_vector', 'posts', ['search_vector'],
+                        unique=False, postgresql_using='gin')
+    elif dialect == 'sqlite':
+        op.execute('CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(title, body)')
+        op.execute("INSERT INTO posts_fts (rowid, title, body) "
+                   "SELECT id, coalesce(title, ''), coalesce(body, '') FROM posts")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('ix_posts_search_vector', table_name='posts')
+        op.drop_column('posts', 'search_vector')
+    elif dialect == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS posts_fts')
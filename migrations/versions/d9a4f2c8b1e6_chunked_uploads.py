@@ -0,0 +1,42 @@
+"""chunked uploads
+
+Revision ID: d9a4f2c8b1e6
+Revises: c3e7a1d9f4b2
+Create Date: 2026-10-18 17:26:44.318560
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9a4f2c8b1e6'
+down_revision = 'c3e7a1d9f4b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('uploads',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('filename', sa.String(length=128), nullable=True),
+    sa.Column('size', sa.BigInteger(), nullable=True),
+    sa.Column('received', sa.BigInteger(), nullable=True),
+    sa.Column('sha256', sa.String(length=64), nullable=True),
+    sa.Column('created', sa.DateTime(), nullable=True),
+    sa.Column('completed', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('uploads', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_uploads_user_id'), ['user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_uploads_sha256'), ['sha256'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('uploads', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_uploads_sha256'))
+        batch_op.drop_index(batch_op.f('ix_uploads_user_id'))
+
+    op.drop_table('uploads')
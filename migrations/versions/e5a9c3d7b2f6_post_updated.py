@@ -0,0 +1,28 @@
+"""updated timestamp on posts
+
+Revision ID: e5a9c3d7b2f6
+Revises: d3f8b6c2e4a1
+Create Date: 2026-10-18 12:31:55.871340
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a9c3d7b2f6'
+down_revision = 'd3f8b6c2e4a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated', sa.DateTime(), nullable=True))
+
+    op.execute('UPDATE posts SET updated = created')
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('updated')
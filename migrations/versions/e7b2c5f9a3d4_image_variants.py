@@ -0,0 +1,39 @@
+"""image variants, merch item picture
+
+Revision ID: e7b2c5f9a3d4
+Revises: d9a4f2c8b1e6
+Create Date: 2026-10-18 18:02:19.551207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b2c5f9a3d4'
+down_revision = 'd9a4f2c8b1e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('image_variants',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('source', sa.String(length=64), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('height', sa.Integer(), nullable=False),
+    sa.Column('format', sa.String(length=8), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('source', 'width', 'format', name='uq_image_variants_source_width_format')
+    )
+    with op.batch_alter_table('merch_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('merch_item', schema=None) as batch_op:
+        batch_op.drop_column('image')
+
+    op.drop_table('image_variants')
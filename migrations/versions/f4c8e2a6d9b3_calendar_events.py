@@ -0,0 +1,36 @@
+"""calendar events
+
+Revision ID: f4c8e2a6d9b3
+Revises: e7b2c5f9a3d4
+Create Date: 2026-10-18 19:40:03.716284
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c8e2a6d9b3'
+down_revision = 'e7b2c5f9a3d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=140), nullable=False),
+    sa.Column('description', sa.Text(), nullable=True),
+    sa.Column('start', sa.DateTime(), nullable=False),
+    sa.Column('end', sa.DateTime(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=True),
+    sa.Column('created', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['author_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_events_start_end', 'events', ['start', 'end'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_events_start_end', table_name='events')
+    op.drop_table('events')
@@ -12,4 +12,6 @@ while true; do
     sleep 5
 done
   
-exec gunicorn --bind 0.0.0.0:5000  --access-logfile - --error-logfile - flask_proj:app
\ No newline at end of file
+# threaded workers: each open notification stream holds a thread
+exec gunicorn --bind 0.0.0.0:5000 --worker-class gthread --workers ${WEB_CONCURRENCY:-2} \
+    --threads ${GUNICORN_THREADS:-32} --access-logfile - --error-logfile - flask_proj:app
\ No newline at end of file
@@ -1,25 +1,22 @@
 import pytest
-from app import create_app
-from flask_sqlalchemy import SQLAlchemy
+from app import create_app, db as _db
 
 
 @pytest.fixture(scope='module')
 def app():
     app = create_app('testing')
     with app.app_context():
-        db = SQLAlchemy(app=app)
-        db.create_all()
+        _db.create_all()
         yield app
-        db.drop_all()
+        _db.drop_all()
 
 
 @pytest.fixture(scope='function')
 def db(app):
     with app.app_context():
-        db = SQLAlchemy(app=app)
-        db.create_all()
-        yield db
-        db.session.remove()
+        _db.create_all()
+        yield _db
+        _db.session.remove()
 
 
 @pytest.fixture(scope='function')
@@ -32,3 +29,15 @@ def client(app, db):
 def runner(app, db):
     with app.test_cli_runner() as runner:
         yield runner
+
+
+# in-process redis (with Lua) behind app.redis and the task queue
+@pytest.fixture(scope='function')
+def redis(app, monkeypatch):
+    import fakeredis
+    import rq
+    server = fakeredis.FakeRedis()
+    monkeypatch.setattr(app, 'redis', server)
+    monkeypatch.setattr(app, 'task_queue', rq.Queue('flask_proj-tasks', connection=server))
+    yield server
+    server.flushall()
@@ -53,5 +53,95 @@ def test_token_auth(client, db):
     assert response.status_code == 200
 
 
+def test_posts_cursor_pagination(client, db):
+    u = User(email='walker@example.com', username='walker')
+    db.session.add(u)
+    db.session.commit()
+    for i in range(25):
+        db.session.add(Post(title='walk post %d' % i, body='body', author_id=u.id))
+    db.session.commit()
+
+    seen = []
+    url = '/api/posts/?count=1'
+    response = client.get(url)
+    assert json.loads(response.get_data(as_text=True))['count'] >= 25
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        data = json.loads(response.get_data(as_text=True))
+        seen.extend(post['url'] for post in data['posts'])
+        url = data['next']
+    assert len(seen) == len(set(seen)) == Post.query.count()
+
+    response = client.get('/api/posts/?after=not-a-cursor')
+    assert response.status_code == 400
+
+
+def test_posts_cursor_etag_follows_next_link(client, db):
+    u = User(email='edge@example.com', username='edge')
+    db.session.add(u)
+    db.session.commit()
+    for i in range(3):
+        db.session.add(Post(title='edge post %d' % i, body='body', author_id=u.id))
+    db.session.commit()
+
+    # a page holding every post but the oldest, which only shows as the next link
+    url = '/api/posts/?per_page=%d' % (Post.query.count() - 1)
+    response = client.get(url)
+    assert json.loads(response.get_data(as_text=True))['next']
+    etag = response.headers['ETag']
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    db.session.delete(Post.query.order_by(Post.created, Post.id).first())
+    db.session.commit()
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert json.loads(response.get_data(as_text=True))['next'] is None
+
+
+def test_post_conditional_get(client, db):
+    u = User(email='etag@example.com', username='etag')
+    db.session.add(u)
+    db.session.commit()
+    p = Post(title='etag post', body='body', author_id=u.id)
+    db.session.add(p)
+    db.session.commit()
+
+    response = client.get('/api/posts/%d' % p.id)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    response = client.get('/api/posts/%d' % p.id, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    u.like_post(p)
+    db.session.commit()
+    response = client.get('/api/posts/%d' % p.id, headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert json.loads(response.get_data(as_text=True))['likes'] == 1
+
+    response = client.get('/post/etag-post/')
+    assert response.status_code == 200
+    response = client.get('/post/etag-post/', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+
+
+def test_notifications_since(client, db):
+    u = User(email='notified@example.com', username='notified')
+    db.session.add(u)
+    db.session.commit()
+    first = u.add_notification('task_progress', {'progress': 0})
+    u.add_notification('unread_message_count', {'count': 2})
+    db.session.commit()
+    token = u.get_token()
+    db.session.commit()
+    headers = {'Authorization': 'Bearer ' + token, 'Accept': 'application/json'}
+
+    response = client.get('/api/notifications', headers=headers)
+    assert response.status_code == 200
+    data = json.loads(response.get_data(as_text=True))
+    assert [n['name'] for n in data] == ['task_progress', 'unread_message_count']
 
-       
+    response = client.get('/api/notifications?since=%r' % first.timestamp, headers=headers)
+    data = json.loads(response.get_data(as_text=True))
+    assert [n['name'] for n in data] == ['unread_message_count']
@@ -0,0 +1,38 @@
+from flask import Response, stream_with_context
+from app.cache import cached, invalidate, TAG_PREFIX
+from app.models import User, Post
+
+
+def test_response_cache(app, client, db, redis, monkeypatch):
+    monkeypatch.setitem(app.config, 'RESPONSE_CACHE', True)
+    u = User(email='cached@example.com', username='cached')
+    db.session.add(u)
+    db.session.commit()
+    db.session.add(Post(title='cached post', body='body', author_id=u.id))
+    db.session.commit()
+
+    assert 'X-Cache' not in client.get('/blog/posts').headers
+    response = client.get('/blog/posts')
+    assert response.headers['X-Cache'] == 'HIT' and b'cached post' in response.data
+    assert redis.scard(TAG_PREFIX + 'post-list') == 1
+
+    invalidate('post-list')
+    assert not redis.exists(TAG_PREFIX + 'post-list')
+    assert not redis.keys('cache:view:*')
+    assert 'X-Cache' not in client.get('/blog/posts').headers
+
+
+def test_streamed_responses_are_not_cached(app, db, redis, monkeypatch):
+    monkeypatch.setitem(app.config, 'RESPONSE_CACHE', True)
+
+    @cached('streamed', per_user=False)
+    def view():
+        return Response(stream_with_context(iter(['streamed'])))
+
+    for _ in range(2):
+        with app.test_request_context('/streamed'):
+            response = view()
+            assert 'X-Cache' not in response.headers
+            assert response.get_data() == b'streamed'
+    assert not redis.keys('cache:view:*')
+    assert not redis.exists(TAG_PREFIX + 'streamed')
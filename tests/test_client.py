@@ -54,3 +54,364 @@ def test_export_posts(app, db):
 
         db.session.commit()
         assert contact.tasks is not None
+
+
+def test_posts_list(client, db):
+    user = User(username='lister', email='lister@example.com')
+    db.session.add(user)
+    db.session.commit()
+    db.session.add(Post(title='listed post', body='body', author_id=user.id))
+    db.session.commit()
+
+    response = client.get('/blog/posts')
+    assert response.status_code == 200
+    assert b'listed post' in response.data
+    assert b'0</span> likes' in response.data
+
+
+def test_posts_list_cursor_links(client, db):
+    import re
+    user = User(username='pager', email='pager@example.com')
+    db.session.add(user)
+    db.session.commit()
+    for i in range(7):
+        db.session.add(Post(title='paged post %d' % i, body='body', author_id=user.id))
+    db.session.commit()
+
+    html = client.get('/blog/posts').get_data(as_text=True)
+    after = re.search(r'href="(/blog/posts\?after=[\w-]+)"', html)
+    assert after is not None
+    assert 'paged post 1' in client.get(after.group(1)).get_data(as_text=True)
+    assert 'paged post 1' in client.get('/blog/posts?page=2').get_data(as_text=True)
+
+
+def test_posts_search(client, db):
+    user = User(username='writer', email='writer@example.com')
+    user.set_password('password')
+    user.role = Role(name='Writer', permissions=Permission.WRITE | Permission.MODERATE)
+    db.session.add(user)
+    db.session.commit()
+    client.post('/auth/login', data={'email': 'writer@example.com', 'password': 'password'})
+    client.post('/create-post', data={'title': 'Searchable', 'body': 'about <b>rhubarb</b> pie'})
+    client.post('/create-post', data={'title': 'Other', 'body': 'nothing to see'})
+
+    response = client.get('/blog/posts?q=rhubarb')
+    assert response.status_code == 200
+    assert b'Searchable' in response.data
+    assert b'Other' not in response.data
+    assert b'&lt;b&gt;<mark>rhubarb</mark>&lt;/b&gt;' in response.data
+
+    client.get('/Searchable/delete-post')
+    response = client.get('/blog/posts?q=rhubarb')
+    assert b'Searchable' not in response.data
+
+
+def test_post_detail_comments(client, db):
+    user = User(username='commenter', email='commenter@example.com')
+    db.session.add(user)
+    db.session.commit()
+    p1 = Post(title='commented post', body='body', author_id=user.id)
+    p2 = Post(title='other commented post', body='body', author_id=user.id)
+    db.session.add_all([p1, p2])
+    db.session.commit()
+    db.session.add_all([Comment(body='on first', author=user, post=p1),
+                        Comment(body='on second', author=user, post=p2)])
+    p1.comment_count = p2.comment_count = 1
+    db.session.commit()
+
+    response = client.get('/post/commented-post/')
+    assert response.status_code == 200
+    assert b'on first' in response.data
+    assert b'on second' not in response.data
+    assert b'commenter' in response.data
+    assert client.get('/post/no-such-post/').status_code == 404
+
+
+def test_like_action_json(client, db):
+    user = User(username='liker', email='liker@example.com')
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    post = Post(title='liked post', body='body', author_id=user.id)
+    db.session.add(post)
+    db.session.commit()
+    client.post('/auth/login', data={'email': 'liker@example.com', 'password': 'password'})
+
+    headers = {'Accept': 'application/json'}
+    for _ in range(2):
+        response = client.post('/like/%d/like' % post.id, headers=headers)
+        assert response.status_code == 200
+        assert response.get_json() == {'post_id': post.id, 'liked': True, 'likes': 1}
+    response = client.post('/like/%d/unlike' % post.id, headers=headers)
+    assert response.get_json()['likes'] == 0
+    assert Like.query.filter_by(post_id=post.id).count() == 0
+
+
+def test_subscribe_and_contact(client, db):
+    response = client.post('/subscribe', data={'email': 'Reader@example.com'})
+    assert b'successfully subscribe' in response.data
+    response = client.post('/subscribe', data={'email': 'reader@example.com'})
+    assert b'already subscribed' in response.data
+    assert Subscribe.query.filter_by(email='reader@example.com').count() == 1
+
+    for _ in range(2):
+        client.post('/contact', data={'email': 'asker@example.com', 'name': 'Asker',
+                                      'subject': 'hi', 'message': 'hello'})
+    assert ContactUs.query.filter_by(email='asker@example.com').one().message == 'hello'
+
+
+def test_chunked_upload(app, client, db, tmp_path, monkeypatch):
+    import hashlib
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.config, 'UPLOAD_CHUNK_SIZE', 4)
+    user = User(username='uploader', email='uploader@example.com')
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    client.post('/auth/login', data={'email': 'uploader@example.com', 'password': 'password'})
+
+    content = b'0123456789'
+    digest = hashlib.sha256(content).hexdigest()
+    response = client.post('/uploads', json={'filename': 'a.exe', 'size': 10})
+    assert response.status_code == 400
+    response = client.post('/uploads', json={'filename': 'a.jpg', 'size': 10})
+    assert response.status_code == 201
+    url = '/uploads/' + response.get_json()['id']
+
+    assert client.put(url + '?offset=0', data=content[:5]).status_code == 413
+    assert client.put(url + '?offset=0', data=content[:4]).get_json()['received'] == 4
+    response = client.put(url + '?offset=0', data=content[:4])
+    assert response.status_code == 409 and response.get_json()['received'] == 4
+    assert client.post(url + '/finalize').status_code == 409
+    client.put(url + '?offset=4', data=content[4:8])
+    assert client.get(url).get_json()['received'] == 8
+    client.put(url + '?offset=8', data=content[8:])
+    response = client.post(url + '/finalize')
+    assert response.get_json()['sha256'] == digest
+    assert (tmp_path / 'sha256' / digest[:2] / digest).read_bytes() == content
+
+    # the same content again is stored once
+    response = client.post('/uploads', json={'filename': 'b.png', 'size': 10})
+    url = '/uploads/' + response.get_json()['id']
+    for offset in range(0, 10, 4):
+        client.put(url + '?offset=%d' % offset, data=content[offset:offset + 4])
+    assert client.post(url + '/finalize').get_json()['sha256'] == digest
+    assert len(list((tmp_path / 'sha256').rglob('*'))) == 2
+    assert not list((tmp_path / 'partial').iterdir())
+
+
+def test_upload_chunk_claims_and_expiry(app, client, db, tmp_path, monkeypatch):
+    from datetime import datetime, timedelta
+    from app import uploads
+    from app.models import Upload
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    user = User(username='claimer', email='claimer@example.com')
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    client.post('/auth/login', data={'email': 'claimer@example.com', 'password': 'password'})
+    upload_id = client.post('/uploads', json={'filename': 'c.jpg', 'size': 8}).get_json()['id']
+
+    # another request is writing the first chunk
+    upload = Upload.query.get(upload_id)
+    assert upload.claim(0)
+    response = client.put('/uploads/%s?offset=0' % upload_id, data=b'0123')
+    assert response.status_code == 409 and response.get_json()['received'] == 0
+    # ... until its claim goes stale
+    upload.claimed = datetime.utcnow() - timedelta(hours=1)
+    db.session.commit()
+    assert client.put('/uploads/%s?offset=0' % upload_id, data=b'0123').status_code == 200
+    assert Upload.query.get(upload_id).claimed is None
+
+    upload = Upload.query.get(upload_id)
+    upload.created = datetime.utcnow() - timedelta(days=2)
+    db.session.commit()
+    assert uploads.expire() == 1
+    assert Upload.query.get(upload_id) is None
+    assert not (tmp_path / 'partial' / upload_id).exists()
+
+
+def test_fingerprinted_assets(tmp_path):
+    import gzip
+    from flask import Flask, url_for
+    from app import assets
+    (tmp_path / 'style.css').write_text('body { color: red; }\n' * 50)
+    (tmp_path / 'img').mkdir()
+    (tmp_path / 'img' / 'logo.png').write_bytes(b'\x89PNG not really')
+    manifest = assets.build(str(tmp_path))
+    assert manifest['style.css'].startswith('dist/style.') and \
+        manifest['img/logo.png'].startswith('dist/img/logo.')
+
+    app = Flask(__name__, static_folder=str(tmp_path), static_url_path='/static')
+    assets.init_app(app)
+    with app.test_request_context():
+        url = url_for('static', filename='style.css')
+    assert url == '/static/' + manifest['style.css']
+
+    client = app.test_client()
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert gzip.decompress(response.data) == (tmp_path / 'style.css').read_bytes()
+    response = client.get(url)
+    assert 'Content-Encoding' not in response.headers
+    assert client.get('/static/style.css').status_code == 200
+
+
+def test_response_compression():
+    import gzip
+    import brotli
+    from flask import Flask, Response, jsonify
+    from app.compress import CompressMiddleware
+    app = Flask(__name__)
+    app.wsgi_app = CompressMiddleware(app.wsgi_app, min_size=100)
+
+    @app.route('/big')
+    def big():
+        return jsonify(items=list(range(500)))
+
+    @app.route('/small')
+    def small():
+        return 'tiny'
+
+    @app.route('/stream')
+    def stream():
+        return Response(('line %d\n' % i for i in range(1000)), mimetype='text/plain')
+
+    @app.route('/image')
+    def image():
+        return Response(b'\xff\xd8' * 1000, mimetype='image/jpeg')
+
+    # a bare WSGI app that calls start_response from inside its iterator
+    def lazy_app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'application/json')])
+        for i in range(200):
+            yield b'{"n": %d}\n' % i
+
+    def parts(encoding):
+        middleware = CompressMiddleware(lazy_app, min_size=100)
+        environ = {'REQUEST_METHOD': 'GET', 'HTTP_ACCEPT_ENCODING': encoding}
+        headers = {}
+        body = list(middleware(environ, lambda status, h, exc_info=None: headers.update(h)))
+        return headers, body
+
+    headers, body = parts('gzip')
+    assert headers['Content-Encoding'] == 'gzip'
+    # one flushed block per chunk, not a single block at the end
+    assert len(body) == 201
+    assert gzip.decompress(b''.join(body)).count(b'\n') == 200
+    headers, body = parts('br')
+    assert len(body) == 201 and brotli.decompress(b''.join(body)).count(b'\n') == 200
+
+    client = app.test_client()
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert gzip.decompress(response.data).startswith(b'{')
+    response = client.get('/stream', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.headers['Content-Encoding'] == 'br'
+    assert 'Content-Length' not in response.headers
+    assert brotli.decompress(response.data).count(b'\n') == 1000
+    for url in ('/small', '/image'):
+        response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+    response = client.get('/big')
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_calendar_events(client, db):
+    from datetime import datetime
+    from app.models import Event
+    db.session.add(Event(title='Launch <party>', start=datetime(2030, 3, 30, 18),
+                         end=datetime(2030, 4, 2, 12)))
+    db.session.add(Event(title='Later', start=datetime(2030, 6, 1), end=datetime(2030, 6, 1)))
+    db.session.commit()
+
+    response = client.get('/calendar/calendar?year=2030&month=4')
+    assert response.status_code == 200
+    html = response.get_data(as_text=True)
+    assert html.count('data-events="1"') == 2
+    assert 'Launch &lt;party&gt;' in html and 'Later' not in html
+    html = client.get('/calendar/calendar?year=2030').get_data(as_text=True)
+    assert 'data-date="2030-12-31"' in html
+
+    response = client.get('/calendar/events?start=2030-03-01&end=2030-03-31')
+    assert [e['title'] for e in response.get_json()['events']] == ['Launch <party>']
+    assert response.get_json()['events'][0]['start'] == '2030-03-30T18:00:00'
+    response = client.get('/calendar/events?start=2030-01-01&end=2031-12-31',
+                          headers={'Accept': 'application/json'})
+    assert response.status_code == 400
+
+
+def test_shop_etag_follows_edits(client, db):
+    from app.models import MerchItem
+    item = MerchItem(name='mug', description='white', price=5)
+    db.session.add(item)
+    db.session.commit()
+    etag = client.get('/sale/shop').headers['ETag']
+    assert client.get('/sale/shop', headers={'If-None-Match': etag}).status_code == 304
+    item.price = 6
+    db.session.commit()
+    assert client.get('/sale/shop', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get('/sale/shop?page=1').headers['ETag'] != \
+        client.get('/sale/shop').headers['ETag']
+
+
+def test_buy_merch_item(client, db):
+    from app.models import MerchItem, Order
+    user = User(username='buyer', email='buyer@example.com')
+    user.set_password('password')
+    item = MerchItem(name='hoodie', description='black', price=30, stock=1)
+    db.session.add_all([user, item])
+    db.session.commit()
+    client.post('/auth/login', data={'email': 'buyer@example.com', 'password': 'password'})
+
+    url = '/sale/%d/buy' % item.id
+    headers = {'Accept': 'application/json', 'Idempotency-Key': 'first'}
+    response = client.post(url, headers=headers)
+    assert response.status_code == 202
+    order = response.get_json()
+    assert order['status'] == 'reserved' and order['price'] == 30
+    # a retry gets the same order back, not a second unit
+    response = client.post(url, headers=headers)
+    assert response.status_code == 200 and response.get_json()['id'] == order['id']
+    assert MerchItem.query.get(item.id).stock == 0
+    other = MerchItem(name='cap', description='red', price=10, stock=5)
+    db.session.add(other)
+    db.session.commit()
+    # the same key for another item is not a retry
+    assert client.post('/sale/%d/buy' % other.id, headers=headers).status_code == 422
+    assert MerchItem.query.get(other.id).stock == 5
+    assert client.get('/sale/item/%d' % other.id).status_code == 200
+    assert client.get('/sale/item/999').status_code == 404
+
+    headers['Idempotency-Key'] = 'second'
+    assert client.post(url, headers=headers).status_code == 409
+    assert client.post(url, headers={'Accept': 'application/json'}).status_code == 400
+    assert Order.query.count() == 1
+    assert client.get(order['url']).get_json()['id'] == order['id']
+
+
+def test_notification_stream(app, client, db, redis, monkeypatch):
+    from app import notifications
+    monkeypatch.setitem(app.config, 'NOTIFICATION_STREAM_TIMEOUT', 0)
+    user = User(username='listener', email='listener@example.com')
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    user.add_notification('task_progress', {'task_id': 't', 'progress': 40})
+    db.session.commit()
+    client.post('/auth/login', data={'email': 'listener@example.com', 'password': 'password'})
+    assert b'notifications.js' in client.get('/blog/posts').data
+
+    response = client.get('/notifications/stream?since=0')
+    assert response.mimetype == 'text/event-stream'
+    assert 'event: task_progress' in response.get_data(as_text=True)
+    response.close()
+    assert notifications._open_streams[0] == 0
+
+    monkeypatch.setitem(app.config, 'NOTIFICATION_STREAMS_MAX', 0)
+    response = client.get('/notifications/stream')
+    assert response.status_code == 503 and response.headers['Retry-After'] == '30'
@@ -0,0 +1,65 @@
+import gzip
+import json
+import os
+from app.exports import write_export
+from app.models import User, Post
+
+
+def test_write_export(app, db, tmp_path):
+    u = User(username='exporter', email='exporter@example.com')
+    db.session.add(u)
+    db.session.commit()
+    for i in range(5):
+        db.session.add(Post(title='export %d' % i, body='body %d' % i, author_id=u.id))
+    db.session.commit()
+
+    ticks = []
+    path = str(tmp_path / 'out' / 'task.ndjson.gz')
+    assert write_export(u.id, path, chunk_size=2, progress=lambda *a: ticks.append(a)) == 5
+    assert ticks == [(2, 5), (4, 5)]
+    with gzip.open(path, 'rt') as f:
+        rows = [json.loads(line) for line in f]
+    assert [row['body'] for row in rows] == ['body %d' % i for i in range(5)]
+
+    path = str(tmp_path / 'task.json.gz')
+    write_export(u.id, path, fmt='json')
+    with gzip.open(path, 'rt') as f:
+        assert len(json.load(f)['posts']) == 5
+    assert not os.path.exists(path + '.part')
+
+
+def test_progress_reporter_coalesces(app, db, monkeypatch):
+    from app import progress
+    from app.models import Task
+    u = User(username='reporter', email='reporter@example.com')
+    db.session.add(u)
+    db.session.commit()
+    task = Task(id='task-1', name='export_posts', description='Exporting', user=u)
+    db.session.add(task)
+    db.session.commit()
+
+    written = []
+    monkeypatch.setattr(progress, '_write', lambda user_id, task_id, entry:
+                        written.append(entry['progress']))
+    reporter = progress.ProgressReporter(task)
+    reporter.min_interval = 3600
+    reporter.start()
+    for p in range(100):
+        reporter.update(p)
+    assert written == list(range(0, 100, 5))
+    assert not task.complete
+    reporter.finish()
+    assert written[-1] == 100 and task.complete
+    assert u.notifications.count() == 1
+
+
+def test_launch_task_registers_progress(app, db, redis):
+    from app import progress
+    u = User(username='launcher', email='launcher@example.com')
+    db.session.add(u)
+    db.session.commit()
+    task = u.launch_task('export_posts', 'Exporting posts...')
+    db.session.commit()
+    assert task.user_id == u.id
+    assert progress.user_tasks(u.id)[task.id]['state'] == 'queued'
+    assert not redis.exists('tasks:progress:None')
@@ -0,0 +1,52 @@
+import io
+from PIL import Image
+from app import images, uploads
+from app.models import ImageVariant
+
+
+def test_image_variants(app, db, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.config, 'IMAGE_WIDTHS', [320, 640, 1600])
+    data = io.BytesIO()
+    Image.new('RGB', (1000, 500), 'red').save(data, 'JPEG')
+    data.seek(0)
+    sha256 = uploads.store_stream(data)
+
+    assert images.make_variants(sha256) == 6
+    assert images.make_variants(sha256) == 0
+    assert sorted({(v.width, v.height) for v in ImageVariant.query.filter_by(source=sha256)}) == \
+        [(320, 160), (640, 320), (1000, 500)]
+    webp = ImageVariant.query.filter_by(source=sha256, format='webp', width=320).one()
+    assert images.sniff_mimetype(uploads.blob_path(webp.sha256)) == 'image/webp'
+    with app.test_request_context():
+        srcsets = images.srcsets([sha256, None])[sha256]
+    assert srcsets['jpeg'].count('w, ') == 2 and srcsets['webp'].endswith(' 1000w')
+
+
+def test_image_variants_race(app, db, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.config, 'IMAGE_WIDTHS', [320])
+    data = io.BytesIO()
+    Image.new('RGB', (640, 320), 'blue').save(data, 'JPEG')
+    data.seek(0)
+    sha256 = uploads.store_stream(data)
+
+    # another job records the same variant while this one renders
+    resized = images._resized
+
+    def racing(original):
+        db.session.connection().execute(ImageVariant.__table__.insert().values(
+            source=sha256, width=320, height=160, format='jpeg', sha256='0' * 64))
+        return resized(original)
+    monkeypatch.setattr(images, '_resized', racing)
+    assert images.make_variants(sha256) == 0
+
+
+def test_background_variants(client, tmp_path, monkeypatch):
+    for name in ('backg-320.jpg', 'backg-320.webp', 'backg-1024.jpg', 'backg-1024.webp'):
+        (tmp_path / name).write_bytes(b'')
+    monkeypatch.setattr(images, 'static_variants_dir', lambda: str(tmp_path))
+    monkeypatch.setattr(images, '_static_variants', {})
+    html = client.get('/').get_data(as_text=True)
+    assert html.index('max-width: 1024px') < html.index('max-width: 320px')
+    assert 'url("/static/variants/backg-320.webp") type("image/webp")' in html
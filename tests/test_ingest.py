@@ -0,0 +1,43 @@
+from app import ingest
+from app.models import ContactUs, Subscribe
+
+
+def test_record_and_flush(app, db, redis):
+    assert ingest.record('subscribe', 'reader@example.com')
+    assert not ingest.record('subscribe', 'reader@example.com')
+    assert ingest.record('contact', 'reader@example.com', name='Reader', message='hi')
+    # one key per email, each with its own expiry
+    assert 0 < redis.ttl('ingest:seen:subscribe:reader@example.com') <= app.config['FORM_SEEN_TTL']
+    assert len(app.task_queue.scheduled_job_registry) == 1
+
+    assert ingest.flush() == 2
+    assert Subscribe.query.filter_by(email='reader@example.com').count() == 1
+    assert ContactUs.query.filter_by(email='reader@example.com').one().name == 'Reader'
+    assert redis.xlen(ingest.STREAM) == 0
+    assert ingest.flush() == 0
+
+
+def test_flush_dead_letters_refused_rows(app, db, redis, monkeypatch):
+    from sqlalchemy.exc import DataError
+    insert_ignore_many = ContactUs.insert_ignore_many
+
+    # what postgres does with a value longer than the column
+    def refuse_long_names(rows):
+        if any(len(row.get('name') or '') > 50 for row in rows):
+            raise DataError('INSERT', {}, Exception('value too long'))
+        return insert_ignore_many(rows)
+    monkeypatch.setattr(ContactUs, 'insert_ignore_many', refuse_long_names)
+
+    ingest.record('contact', 'bad@example.com', name='x' * 60, message='hi')
+    ingest.record('contact', 'good@example.com', name='Good', message='hi')
+    assert ingest.flush() == 2
+    assert ContactUs.query.filter_by(email='good@example.com').count() == 1
+    assert redis.xlen(ingest.STREAM) == 0
+    assert redis.xlen(ingest.DEAD) == 1
+
+
+def test_over_long_fields_are_rejected(client, db):
+    response = client.post('/contact', data={'email': 'long@example.com', 'name': 'x' * 51,
+                                             'subject': 'hi', 'message': 'hello'})
+    assert b'Check your entries' in response.data
+    assert ContactUs.query.filter_by(email='long@example.com').count() == 0
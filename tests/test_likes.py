@@ -0,0 +1,60 @@
+from app import likes
+from app.models import User, Post, Like
+
+
+def make_users_and_post(db, names):
+    users = [User(username=name, email=name + '@example.com') for name in names]
+    db.session.add_all(users)
+    db.session.commit()
+    post = Post(title='buffered likes ' + names[0], body='body', author_id=users[0].id)
+    db.session.add(post)
+    db.session.commit()
+    return users, post
+
+
+def test_record_and_pending(app, db, redis):
+    (u1, u2, u3), post = make_users_and_post(db, ['pend1', 'pend2', 'pend3'])
+    u3.like_post(post)
+    db.session.commit()
+
+    likes.record(u1.id, post.id, True)
+    likes.record(u2.id, post.id, True)
+    likes.record(u2.id, post.id, False)
+    likes.record(u3.id, post.id, False)
+    assert likes.pending_state(u1.id, [post.id]) == {post.id: True}
+    assert likes.pending_state(u2.id, [post.id]) == {post.id: False}
+    assert likes.pending_delta([post.id]) == {post.id: -1}
+    assert redis.xlen(likes.EVENTS) == 4
+    # one flush is scheduled however many clicks come in
+    assert len(app.task_queue.scheduled_job_registry) == 1
+
+
+def test_take_pending_keeps_newest_click(app, db, redis):
+    on, off, on_flushing, off_flushing = likes._keys(1)
+    # a flush died after taking user 7's like; the user has unliked since
+    redis.sadd(on_flushing, 7)
+    redis.sadd(off, 7)
+    redis.sadd(on, 8)
+    take_pending = redis.register_script(likes.TAKE_PENDING)
+    taken_on, taken_off = take_pending(keys=likes._keys(1))
+    assert set(taken_on) == {b'8'} and set(taken_off) == {b'7'}
+    assert not redis.exists(on, off)
+
+
+def test_flush(app, db, redis):
+    (u1, u2, u3), post = make_users_and_post(db, ['flush1', 'flush2', 'flush3'])
+    u3.like_post(post)
+    db.session.commit()
+    likes.record(u1.id, post.id, True)
+    likes.record(u2.id, post.id, True)
+    likes.record(u3.id, post.id, False)
+
+    assert likes.flush(batch_size=2) == 3
+    liked = {like.user_id for like in Like.query.filter_by(post_id=post.id)}
+    assert liked == {u1.id, u2.id}
+    db.session.refresh(post)
+    assert post.like_count == 2
+    assert likes.pending_delta([post.id]) == {}
+    assert redis.xlen(likes.EVENTS) == 0
+    assert not redis.exists(likes.FLUSH_LOCK)
+    assert likes.flush() == 0
@@ -0,0 +1,107 @@
+import socketserver
+import threading
+from flask import Flask
+from flask_mail import Mail, Message
+from app.mailer import MailQueue
+
+
+# just enough SMTP to take messages; refuses recipients at refused.example
+class SMTPStub(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connections += 1
+        self.reply('220 stub')
+        while True:
+            line = self.rfile.readline().decode('ascii').strip()
+            if not line:
+                return
+            command = line.split(' ', 1)[0].upper()
+            if command == 'QUIT':
+                self.reply('221 bye')
+                return
+            if command == 'RCPT' and 'refused.example' in line:
+                self.reply('550 no such user')
+            elif command == 'DATA':
+                self.reply('354 go on')
+                data = []
+                while True:
+                    line = self.rfile.readline()
+                    if line == b'.\r\n':
+                        break
+                    data.append(line)
+                self.server.messages.append(b''.join(data))
+                self.reply('250 queued')
+            else:
+                self.reply('250 ok')
+
+    def reply(self, text):
+        self.wfile.write(text.encode('ascii') + b'\r\n')
+
+
+def make_mail_app(port, workers):
+    app = Flask(__name__)
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=port, MAIL_USE_TLS=False,
+                      MAIL_WORKERS=workers, MAIL_BATCH_SIZE=50, MAIL_QUEUE_SIZE=100,
+                      MAIL_QUEUE_TIMEOUT=1, MAIL_RETRIES=1, MAIL_RETRY_BACKOFF=0.01)
+    return app, MailQueue(app, Mail(app))
+
+
+def message(to):
+    return Message('hello', sender='sender@example.com', recipients=[to], body='hi')
+
+
+def test_mail_queue_against_stub():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPStub)
+    server.daemon_threads = True
+    server.connections, server.messages = 0, []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        app, mail_queue = make_mail_app(server.server_address[1], workers=0)
+        with app.app_context():
+            sent = mail_queue.send_batch([message('a@example.com'),
+                                          message('b@refused.example'),
+                                          message('c@example.com')])
+        assert sent == 2
+        assert len(server.messages) == 2
+        assert mail_queue.stats()['failed'] == 1
+
+        server.connections, server.messages = 0, []
+        app, mail_queue = make_mail_app(server.server_address[1], workers=1)
+        for i in range(20):
+            mail_queue.send(message('user%d@example.com' % i))
+        mail_queue.join()
+        assert len(server.messages) == 20
+        assert server.connections < 20
+        assert mail_queue.stats()['sent'] == 20 and mail_queue.depth() == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_newsletter_chunks_and_checkpoint(app, db, monkeypatch):
+    from app import mail, newsletter
+    monkeypatch.setitem(app.config, 'ADMINS', ['news@example.com'])
+    from app.models import Campaign, Subscribe
+    for i in range(7):
+        db.session.add(Subscribe(email='reader%d@example.com' % i))
+    db.session.commit()
+    ids = [s.id for s in Subscribe.query.order_by(Subscribe.id)]
+
+    campaign = Campaign(subject='News', body='Hello readers')
+    db.session.add(campaign)
+    db.session.commit()
+    chunks = list(newsletter.plan(campaign, chunk_size=3))
+    assert [(c.first_id, c.last_id) for c in chunks] == \
+        [(1, ids[2]), (ids[2] + 1, ids[5]), (ids[5] + 1, ids[6])]
+    assert campaign.planned
+
+    # the second chunk died after its first subscriber
+    chunks[1].sent_through = ids[3]
+    chunks[1].processed = 1
+    db.session.commit()
+    with mail.record_messages() as outbox:
+        for chunk in chunks:
+            newsletter.send_chunk(chunk)
+    assert len(outbox) == 6
+    assert 'reader3@example.com' not in [m.recipients[0] for m in outbox]
+    assert campaign.processed_count() == 7
+    assert campaign.finished is not None
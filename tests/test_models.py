@@ -0,0 +1,222 @@
+from werkzeug.security import generate_password_hash
+from app.hashing import PasswordHasher
+from app.models import User, Role, Permission, Post, Like
+
+
+def make_user(db, name):
+    user = User(username=name, email=name + '@example.com')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def make_post(db, user, title):
+    post = Post(title=title, body='body', author_id=user.id)
+    db.session.add(post)
+    db.session.commit()
+    return post
+
+
+def test_preload_feed(db):
+    u1 = make_user(db, 'feed1')
+    u2 = make_user(db, 'feed2')
+    p1 = make_post(db, u1, 'feed post one')
+    p2 = make_post(db, u1, 'feed post two')
+    u1.like_post(p1)
+    u2.like_post(p1)
+    db.session.commit()
+
+    feed = Post.preload_feed([p1, p2], u1)
+    assert feed.has_liked(p1)
+    assert not feed.has_liked(p2)
+    assert Post.like_counts([p1.id, p2.id]) == {p1.id: 2}
+
+
+def test_like_counter(db):
+    u = make_user(db, 'counter')
+    p = make_post(db, u, 'counter post')
+    u.like_post(p)
+    db.session.commit()
+    assert p.like_count == 1
+    u.like_post(p)
+    db.session.commit()
+    assert p.like_count == 1
+    u.unlike_post(p)
+    db.session.commit()
+    assert p.like_count == 0
+
+
+def test_reconcile_counters(db):
+    u = make_user(db, 'drift')
+    p = make_post(db, u, 'drifted post')
+    db.session.add(Like(user_id=u.id, post_id=p.id))
+    db.session.commit()
+    assert p.like_count == 0
+
+    assert Post.reconcile_counters(batch_size=1) >= 1
+    db.session.refresh(p)
+    assert p.like_count == 1
+    assert Post.reconcile_counters() == 0
+
+
+def test_iter_json_matches_to_json(app, db):
+    u = make_user(db, 'serial')
+    p = make_post(db, u, 'serialized post')
+    u.like_post(p)
+    db.session.commit()
+    with app.test_request_context():
+        assert list(Post.iter_json([p])) == [p.to_json()]
+
+
+def test_user_from_cache(db):
+    u = make_user(db, 'cached')
+    u.set_password('secret')
+    token = u.get_token()
+    db.session.commit()
+    data = u.cache_data()
+    assert 'password_hash' not in data
+    db.session.expunge_all()
+
+    user = User.from_cache(data)
+    assert user.id == u.id
+    assert user.token == token
+    assert user.token_expiration == u.token_expiration
+    assert user.check_password('secret')
+    assert User.check_token(token).id == u.id
+
+
+def test_cached_principal_permissions(db):
+    r = Role(name='Cached', permissions=Permission.COMMENT | Permission.WRITE)
+    u = User(username='principal', email='principal@example.com', role=r)
+    db.session.add(u)
+    db.session.commit()
+    data = u.principal_data()
+    db.session.expunge_all()
+
+    user = User.from_cache(data)
+    assert user.can(Permission.WRITE)
+    assert not user.can(Permission.MODERATE)
+
+
+def test_legacy_password_hash_upgrade(db):
+    u = make_user(db, 'legacy')
+    u.password_hash = generate_password_hash('secret')
+    db.session.commit()
+
+    assert not u.check_password('wrong')
+    assert u.password_hash.startswith('pbkdf2:')
+    assert u.check_password('secret')
+    assert u.password_hash.startswith('$pbkdf2-sha256$')
+    assert u.check_password('secret')
+
+
+def test_password_hashing_pool(app):
+    hasher = PasswordHasher(app)
+    hasher.workers = 1
+    pwhash = hasher.hash('secret')
+    assert hasher.verify('secret', pwhash) == (True, None)
+    assert hasher.verify('wrong', pwhash) == (False, None)
+
+
+def test_password_hashing_pool_recovers(app):
+    import pytest
+    from app.exceptions import PasswordHashingBusy
+    hasher = PasswordHasher(app)
+    hasher.workers = 1
+    pwhash = hasher.hash('secret')
+    # a child killed under the pool breaks it; the next call gets a new one
+    broken = hasher._pool
+    for process in list(broken._processes.values()):
+        process.kill()
+        process.join()
+    assert hasher.verify('secret', pwhash) == (True, None)
+    assert hasher._pool is not broken
+
+    hasher.timeout = 0
+    with pytest.raises(PasswordHashingBusy):
+        hasher.hash('secret')
+    hasher.timeout = 10
+    assert hasher.verify('secret', pwhash) == (True, None)
+
+
+def test_local_cache():
+    from app.auth_cache import LocalCache
+    cache = LocalCache(maxsize=2)
+    cache.set('a', 1, ttl=60)
+    cache.set('b', 2, ttl=60)
+    assert cache.get('a') == 1
+    cache.set('c', 3, ttl=60)
+    # 'b' was the least recently used
+    assert cache.get('b') is None and cache.get('a') == 1
+    cache.set('d', 4, ttl=-1)
+    assert cache.get('d') is None
+    cache.pop('a')
+    assert cache.get('a') is None
+
+
+def token_cache(app, redis, monkeypatch):
+    from app.auth_cache import TokenCache
+    monkeypatch.setitem(app.config, 'TOKEN_CACHE', True)
+    cache = TokenCache(app)
+    monkeypatch.setattr(app, 'token_cache', cache)
+    return cache
+
+
+def test_token_cache(app, db, redis, monkeypatch):
+    cache = token_cache(app, redis, monkeypatch)
+    u = make_user(db, 'tokencache')
+    token = u.get_token()
+    db.session.commit()
+
+    assert User.check_token(token).id == u.id
+    assert cache.get(token)['id'] == u.id
+    cache.evict(token)
+    assert cache.get(token) is None
+
+    # never kept past the token's own expiry
+    data = dict(u.cache_data(), token_expiration='2000-01-01T00:00:00')
+    cache.set('old', data)
+    assert cache.get('old') is None
+
+
+def test_revoked_token_evicted_after_commit(app, db, redis, monkeypatch):
+    cache = token_cache(app, redis, monkeypatch)
+    u = make_user(db, 'revoked')
+    token = u.get_token()
+    db.session.commit()
+    assert User.check_token(token) is not None
+
+    u.revoke_token()
+    assert cache.get(token) is not None
+    db.session.commit()
+    assert cache.get(token) is None
+    assert User.check_token(token) is None
+
+    token = u.get_token()
+    db.session.commit()
+    User.check_token(token)
+    u.revoke_token()
+    db.session.rollback()
+    assert cache.get(token) is not None
+
+
+def test_principal_evicted_after_commit(app, db, redis, monkeypatch):
+    from app.auth_cache import PrincipalCache
+    from app.models import load_user
+    monkeypatch.setitem(app.config, 'PRINCIPAL_CACHE', True)
+    cache = PrincipalCache(app)
+    monkeypatch.setattr(app, 'user_cache', cache)
+    u = make_user(db, 'principalcache')
+    load_user(str(u.id))
+    assert cache.get(str(u.id))['username'] == 'principalcache'
+
+    u.username = 'renamed'
+    db.session.flush()
+    assert cache.get(str(u.id)) is not None
+    db.session.commit()
+    assert cache.get(str(u.id)) is None
+
+    load_user(str(u.id))
+    db.session.add(Role(name='Evicting', permissions=0))
+    db.session.commit()
+    assert cache.get(str(u.id)) is None